@@ -32,13 +32,12 @@ __revision__ = '$Format:%H$'
 
 from qgis.PyQt.QtCore import QCoreApplication
 from qgis.core import (QgsProcessing,
-                       QgsFeatureSink,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterFeatureSource,
-                       QgsProcessingParameterFeatureSink, QgsCoordinateTransform, QgsCoordinateReferenceSystem, QgsProject, QgsProcessingParameterNumber, QgsVectorLayer)
+                       QgsProcessingParameterFeatureSink, QgsProcessingParameterField, QgsProcessingParameterFileDestination, QgsProcessingParameterNumber, QgsProcessingParameterString, QgsProcessingParameterBoolean, QgsProcessingParameterDefinition, QgsProcessingParameterEnum)
 from qgis.PyQt.QtGui import QIcon
 
-from .arc_3d_methods import generate_3d_polyline_from_geometry
+from .arc_3d_methods import DEFAULT_BATCH_SIZE, process_3d_arcs
 
 class Arc3DAlgorithm(QgsProcessingAlgorithm):
     """
@@ -63,6 +62,20 @@ class Arc3DAlgorithm(QgsProcessingAlgorithm):
     Y_ANGLE = 'Y_ANGLE'
     Z_SCALE = 'Z_SCALE'
     INPUT = 'INPUT'
+    LEGACY = 'LEGACY'
+    BATCH_SIZE = 'BATCH_SIZE'
+    NATIVE_CRS = 'NATIVE_CRS'
+    GREAT_CIRCLE = 'GREAT_CIRCLE'
+    PROFILE = 'PROFILE'
+    THREADS = 'THREADS'
+    WORKERS = 'WORKERS'
+    FIELDS = 'FIELDS'
+    CACHE = 'CACHE'
+    MAX_ERROR = 'MAX_ERROR'
+    LENGTH_field = 'LENGTH_field'
+    LOD_SEGMENTS = 'LOD_SEGMENTS'
+    VERTEX_BUDGET = 'VERTEX_BUDGET'
+    WEIGHT_field = 'WEIGHT_field'
 
     def initAlgorithm(self, config):
         """
@@ -112,6 +125,138 @@ class Arc3DAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.PROFILE,
+                "Shape of the arcs, the Y-angle leans them and the Z-scale sets the height of their apex",
+                options=["Circle", "Parabola (quadratic Bezier)"],
+                defaultValue=0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MAX_ERROR,
+                "Maximum distance between the arcs and the true curves, in units of the CRS the arcs are built in, 0 to use the number of segments",
+                type=QgsProcessingParameterNumber.Double,
+                minValue=0,
+                defaultValue=0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.LENGTH_field,
+                "Field with the length of the lines on the ground in meters for the maximum distance, in layer units when building in a projected layer CRS, the distance between their endpoints when none is selected",
+                parentLayerParameterName=self.INPUT,
+                type=QgsProcessingParameterField.Numeric,
+                optional=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.VERTEX_BUDGET,
+                "Total number of vertices of the arcs, shared between them by length or weight, 0 to use the number of segments",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                defaultValue=0
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.WEIGHT_field,
+                "Field with the weight of the lines for the vertex budget, the distance between their endpoints when none is selected",
+                parentLayerParameterName=self.INPUT,
+                type=QgsProcessingParameterField.Numeric,
+                optional=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.LOD_SEGMENTS,
+                "Numbers of segments of levels of detail written together and drawn by scale, e.g. 4,8,16, empty for a single level",
+                defaultValue='',
+                optional=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.NATIVE_CRS,
+                "Build the arcs in the CRS of the input layer instead of EPSG:3857",
+                defaultValue=False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.GREAT_CIRCLE,
+                "Build the arcs along great circles, with their heights in meters",
+                defaultValue=False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.FIELDS,
+                "Fields to keep in the output, all of them when none are selected",
+                parentLayerParameterName=self.INPUT,
+                allowMultiple=True,
+                optional=True
+            )
+        )
+
+        legacy_parameter = QgsProcessingParameterBoolean(
+            self.LEGACY,
+            "Build the arcs exactly as earlier versions of the plugin did",
+            defaultValue=False
+        )
+        legacy_parameter.setFlags(legacy_parameter.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(legacy_parameter)
+
+        batch_size_parameter = QgsProcessingParameterNumber(
+            self.BATCH_SIZE,
+            "Number of features processed and written at once",
+            type=QgsProcessingParameterNumber.Integer,
+            minValue=1,
+            defaultValue=DEFAULT_BATCH_SIZE
+        )
+        batch_size_parameter.setFlags(batch_size_parameter.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(batch_size_parameter)
+
+        threads_parameter = QgsProcessingParameterNumber(
+            self.THREADS,
+            "Number of threads building the arcs",
+            type=QgsProcessingParameterNumber.Integer,
+            minValue=1,
+            defaultValue=1
+        )
+        threads_parameter.setFlags(threads_parameter.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(threads_parameter)
+
+        workers_parameter = QgsProcessingParameterNumber(
+            self.WORKERS,
+            "Number of worker processes building the arcs, used instead of the threads when above 1",
+            type=QgsProcessingParameterNumber.Integer,
+            minValue=1,
+            defaultValue=1
+        )
+        workers_parameter.setFlags(workers_parameter.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers_parameter)
+
+        cache_parameter = QgsProcessingParameterFileDestination(
+            self.CACHE,
+            "SQLite file keeping the arcs between runs, so only new or changed features are rebuilt",
+            fileFilter='SQLite files (*.sqlite)',
+            optional=True,
+            createByDefault=False
+        )
+        cache_parameter.setFlags(cache_parameter.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cache_parameter)
+
         # We add a feature sink in which to store our processed features (this
         # usually takes the form of a newly created vector layer when the
         # algorithm is run in QGIS).
@@ -136,42 +281,13 @@ class Arc3DAlgorithm(QgsProcessingAlgorithm):
         segments = self.parameterAsDouble(parameters, self.SEGMENT_SLIDER, context)
         y_angle = self.parameterAsDouble(parameters, self.Y_ANGLE, context)
         z_scale = self.parameterAsDouble(parameters, self.Z_SCALE, context)
-        layer_3d  = QgsVectorLayer(f"LineStringZ?crs=EPSG:{self.crs_3d}", 'temp', "memory")
-        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT,
-                context, source.fields(), layer_3d.wkbType(), source.sourceCrs())
-
-        # Compute the number of steps to display within the progress bar and
-        # get features from source
-        total = 100.0 / source.featureCount() if source.featureCount() else 0
-        features = source.getFeatures()
-        transform_to_3857 = QgsCoordinateTransform(
-                QgsCoordinateReferenceSystem(source.sourceCrs().authid()),
-                QgsCoordinateReferenceSystem(self.crs_3d),
-                QgsProject.instance(),
-            )
-        transform_from_3857 = QgsCoordinateTransform(
-                QgsCoordinateReferenceSystem(self.crs_3d),
-                QgsCoordinateReferenceSystem(source.sourceCrs().authid()),
-                QgsProject.instance(),
-            )
-        
-        for current, feature in enumerate(features):
-            # Stop the algorithm if cancel button has been clicked
-            if feedback.isCanceled():
-                break
-            if '3857' not in source.sourceCrs().authid():
-                geometry_ = feature.geometry()
-                geometry_.transform(transform_to_3857)
-                feature_3d_polyline = generate_3d_polyline_from_geometry(geometry_, segments, y_angle, z_scale)
-                feature_3d_polyline.transform(transform_from_3857)
-            else:
-                feature_3d_polyline = generate_3d_polyline_from_geometry(feature.geometry(), segments, y_angle, z_scale)
-            feature.setGeometry(feature_3d_polyline)
-            # Add a feature in the sink
-            sink.addFeature(feature, QgsFeatureSink.FastInsert)
-
-            # Update the progress bar
-            feedback.setProgress(int(current * total))
+
+        def arc_parameters(chunk):
+            # All the arcs share the parameters of the algorithm
+            return segments, y_angle, z_scale
+
+        # Build the arcs of whole chunks and add them to the sink
+        dest_id = process_3d_arcs(self, parameters, context, feedback, source, arc_parameters)
         print(source.sourceCrs())
         # Return the results of the algorithm. In this case our only result is
         # the feature sink which contains the processed features, but some
@@ -237,4 +353,12 @@ class Arc3DAlgorithm(QgsProcessingAlgorithm):
                        to control the smoothness of the curve select the number of segments \n
                        to control the angle of the curve select the Y-angle from 10-90 \n
                        to control the scewness of the curve select the Z-scale value from 0-1\n
+                       to leave out columns select the fields to keep, the others are not even read\n
+                       to let each arc get as many segments as its length needs set the maximum distance to the true curve, optionally with a length field\n
+                       to write several levels of detail at once list their numbers of segments, each scale then draws only one of them\n
+                       to rebuild only new or changed arcs on later runs select a cache file\n
+                       to skip the EPSG:3857 round trip build the arcs in the CRS of the input layer, geographic layers get arcs along great circles\n
+                       for long-haul flows build the arcs along great circles, their height then grows with the distance flown\n
+                       to draw parabolas instead of circular arcs select the parabola shape\n
+                       to fit a total number of vertices set the vertex budget, the longest or heaviest lines get the most segments\n
                        """)
@@ -0,0 +1,127 @@
+"""
+A persistent cache of 3D arcs, so re-runs only rebuild the arcs that changed.
+
+The arcs are kept in a SQLite file as WKB, one row per feature ID, along
+with a hash of what they were built from: the endpoints, the parameters and
+the settings of the run. It does not import QGIS, see
+cached_3d_polyline_chunks in arc_3d_methods for how it is used.
+"""
+import hashlib
+import sqlite3
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from .arc_3d_engine import arc_rows
+
+# Size in bytes of the hash stored with each arc
+ARC_CACHE_DIGEST_SIZE = 16
+
+
+class ArcCache:
+    """
+    Arcs built by earlier runs, stored in a SQLite file.
+
+    Parameters:
+    path (str): The SQLite file, created if it does not exist.
+    settings (str): Describes everything else the arcs depend on, such as the
+        legacy mode and the CRS they are built in. Arcs built with other
+        settings are never returned.
+
+    """
+
+    def __init__(self, path: str, settings: str = ''):
+        self.path = path
+        self.salt = hashlib.blake2b(settings.encode('utf-8'), digest_size=16).digest()
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS arcs (fid INTEGER PRIMARY KEY, hash BLOB NOT NULL, wkb BLOB NOT NULL)"
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def keys(self, starts: np.ndarray, ends: np.ndarray, segments, y_angle, z_scale) -> List[bytes]:
+        """
+        Hash what each arc is built from.
+
+        Parameters:
+        starts (numpy.ndarray): The (N, 2) start coordinates of the lines.
+        ends (numpy.ndarray): The (N, 2) end coordinates of the lines.
+        segments (int or numpy.ndarray): The number of segments, scalar or one per line.
+        y_angle (float or numpy.ndarray): The angle of rotation around the y-axis in degrees, scalar or one per line.
+        z_scale (float or numpy.ndarray): The scaling factor along the z-axis, scalar or one per line.
+
+        Returns:
+        List[bytes]: The hash of each arc.
+
+        """
+        rows = arc_rows(starts, ends, segments, y_angle, z_scale).astype('<f8')
+        data = rows.tobytes()
+        size = rows.itemsize * 7
+        return [
+            hashlib.blake2b(data[index * size:(index + 1) * size], digest_size=ARC_CACHE_DIGEST_SIZE, key=self.salt).digest()
+            for index in range(rows.shape[0])
+        ]
+
+    def lookup(self, fids: Sequence[int], keys: Sequence[bytes]) -> List[Optional[bytes]]:
+        """
+        Find the arcs built earlier from the same endpoints and parameters.
+
+        Parameters:
+        fids (Sequence[int]): The feature IDs.
+        keys (Sequence[bytes]): The hashes of the arcs, see keys.
+
+        Returns:
+        List[Optional[bytes]]: The WKB of each arc, None when it has to be built.
+
+        """
+        stored = {}
+        fids = [int(fid) for fid in fids]
+        # Stay below the number of variables SQLite accepts in a statement
+        for first in range(0, len(fids), 500):
+            batch = fids[first:first + 500]
+            query = f"SELECT fid, hash, wkb FROM arcs WHERE fid IN ({','.join('?' * len(batch))})"
+            stored.update((fid, (hash_, wkb)) for fid, hash_, wkb in self.connection.execute(query, batch))
+        wkbs = []
+        for fid, key in zip(fids, keys):
+            hash_, wkb = stored.get(fid, (None, None))
+            wkbs.append(wkb if hash_ == key else None)
+        hits = sum(wkb is not None for wkb in wkbs)
+        self.hits += hits
+        self.misses += len(wkbs) - hits
+        return wkbs
+
+    def store(self, fids: Sequence[int], keys: Sequence[bytes], wkbs: Sequence[bytes]) -> None:
+        """
+        Keep newly built arcs, replacing those stored for the same features.
+
+        Parameters:
+        fids (Sequence[int]): The feature IDs.
+        keys (Sequence[bytes]): The hashes of the arcs, see keys.
+        wkbs (Sequence[bytes]): The WKB of the arcs.
+
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO arcs (fid, hash, wkb) VALUES (?, ?, ?)",
+                zip((int(fid) for fid in fids), keys, wkbs),
+            )
+
+    def report(self) -> str:
+        """
+        Describe the use of the cache so far.
+
+        Returns:
+        str: The number of arcs reused and rebuilt.
+
+        """
+        total = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / total if total else 0.0
+        return f"Arc cache {self.path}: {self.hits} arcs reused, {self.misses} rebuilt ({hit_rate:.1f}% reused)"
+
+    def close(self) -> None:
+        """
+        Close the SQLite file.
+
+        """
+        self.connection.close()
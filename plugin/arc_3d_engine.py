@@ -0,0 +1,864 @@
+"""
+The arc math of the plugin, on plain NumPy arrays.
+
+It does not import QGIS, so it loads quickly and runs in worker processes
+and other Python interpreters that only have NumPy. The QGIS algorithms
+read the endpoints of the features, hand them over as arrays and turn the
+vertices back into geometries, see arc_3d_methods.
+"""
+import sys
+import time
+from functools import lru_cache
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Number of distinct (segments, y_angle, z_scale) arc templates kept in memory
+ARC_TEMPLATE_CACHE_SIZE = 1024
+# Largest number of segments per quarter circle chosen by adaptive_segments
+ADAPTIVE_MAX_SEGMENTS = 90
+# ISO WKB geometry type code of a LineStringZ
+WKB_LINESTRING_Z = 1002
+# Mean radius of the earth in meters, used to build arcs from longitudes and latitudes
+EARTH_RADIUS = 6371008.8
+# Radius of the sphere of EPSG:3857, in meters
+WEB_MERCATOR_RADIUS = 6378137.0
+# Shapes of the unit arc templates, see arc_template
+ARC_PROFILES = ('circle', 'parabola')
+
+def _stacked_matrix(shape) -> np.ndarray:
+    """
+    Create a stack of 4x4 identity matrices.
+
+    Parameters:
+    shape (tuple): The shape of the stack, () for a single matrix.
+
+    Returns:
+    numpy.ndarray: The identity matrices with shape (*shape, 4, 4).
+
+    """
+    return np.broadcast_to(np.eye(4), shape + (4, 4)).copy()
+
+def rotation_x(rad_angle):
+    """
+    Perform a rotation around the x-axis.
+
+    Parameters:
+    rad_angle (float or numpy.ndarray): The angle of rotation in radians,
+        or an array of angles for a stack of matrices.
+
+    Returns:
+    numpy.ndarray: The rotation matrix (or matrices, one per angle).
+
+    """
+    cos_, sin_ = np.cos(rad_angle), np.sin(rad_angle)
+    matrix = _stacked_matrix(np.shape(rad_angle))
+    matrix[..., 1, 1] = cos_
+    matrix[..., 1, 2] = -sin_
+    matrix[..., 2, 1] = sin_
+    matrix[..., 2, 2] = cos_
+    return matrix
+
+
+def rotation_y(rad_angle):
+    """
+    Perform a rotation around the y-axis.
+
+    Parameters:
+    rad_angle (float or numpy.ndarray): The angle of rotation in radians,
+        or an array of angles for a stack of matrices.
+
+    Returns:
+    numpy.ndarray: The rotation matrix (or matrices, one per angle).
+
+    """
+    cos_, sin_ = np.cos(rad_angle), np.sin(rad_angle)
+    matrix = _stacked_matrix(np.shape(rad_angle))
+    matrix[..., 0, 0] = cos_
+    matrix[..., 0, 2] = sin_
+    matrix[..., 2, 0] = -sin_
+    matrix[..., 2, 2] = cos_
+    return matrix
+
+def rotation_z(rad_angle):
+    """
+    Perform a rotation around the z-axis.
+
+    Parameters:
+    rad_angle (float or numpy.ndarray): The angle of rotation in radians,
+        or an array of angles for a stack of matrices.
+
+    Returns:
+    numpy.ndarray: The rotation matrix (or matrices, one per angle).
+
+    """
+    cos_, sin_ = np.cos(rad_angle), np.sin(rad_angle)
+    matrix = _stacked_matrix(np.shape(rad_angle))
+    matrix[..., 0, 0] = cos_
+    matrix[..., 0, 1] = -sin_
+    matrix[..., 1, 0] = sin_
+    matrix[..., 1, 1] = cos_
+    return matrix
+
+def scale_z(scale_) -> np.ndarray:
+    """
+    Perform a scaling along the z-axis.
+
+    Parameters:
+    scale_ (float or numpy.ndarray): The scaling factor, or an array of
+        factors for a stack of matrices.
+
+    Returns:
+    numpy.ndarray: The scaling matrix (or matrices, one per factor).
+
+    """
+    matrix = _stacked_matrix(np.shape(scale_))
+    matrix[..., 2, 2] = scale_
+    return matrix
+
+def translate(x, y) -> np.ndarray:
+    """
+    Perform a translation in 3D space.
+
+    Parameters:
+    x (float or numpy.ndarray): The translation distance along the x-axis.
+    y (float or numpy.ndarray): The translation distance along the y-axis.
+
+    Returns:
+    numpy.ndarray: The translation matrix (or matrices, one per distance).
+
+    """
+    matrix = _stacked_matrix(np.broadcast(x, y).shape)
+    matrix[..., 0, 3] = x
+    matrix[..., 1, 3] = y
+    return matrix
+
+def _half_circle(segments: int, legacy: bool = False) -> np.ndarray:
+    """
+    Create the upper half of a unit circle standing in the YZ plane.
+
+    Parameters:
+    segments (int): The number of segments per quarter of the circle.
+    legacy (bool): Recover the half circle from a buffered point polygon, as
+        earlier versions of the plugin did, instead of computing it directly.
+
+    Returns:
+    numpy.ndarray: The 2 * segments + 1 (x, y, z) points, sorted along the y-axis.
+
+    """
+    if legacy:
+        # Only this path needs QGIS, its GEOS buffer is what the arcs used to be made of
+        from qgis.core import QgsGeometry, QgsPointXY
+        circle = QgsGeometry.fromPointXY(QgsPointXY(0, 0)).buffer(1, int(segments))
+        points_array = np.array([[point.x(), point.y(), 0.0, 1.0] for point in circle.asPolygon()[0]])
+        transformed_points = np.dot(points_array, rotation_y(np.radians(90)))
+        transformed_points = transformed_points[transformed_points[:, 2] >= -1e-9]
+        unique_data = np.unique(transformed_points, axis=0)
+        return unique_data[unique_data[:, 1].argsort()][:, :3]
+
+    # The buffer steps around the circle by a quarter turn per `segments`
+    # vertices, so the upper half is sampled at the same angles
+    angles = np.linspace(-np.pi / 2, np.pi / 2, 2 * int(segments) + 1)
+    points = np.zeros((angles.size, 3))
+    points[:, 1] = np.sin(angles)
+    points[:, 2] = np.cos(angles)
+    # Keep the two ends of the half circle exactly on the ground
+    points[[0, -1], 2] = 0.0
+    return points
+
+def _parabola(segments: int) -> np.ndarray:
+    """
+    Create a unit parabola standing in the YZ plane, with the same apex as the half circle.
+
+    It is the quadratic Bezier curve from (0, -1, 0) to (0, 1, 0) with its
+    control point at (0, 0, 2), sampled at evenly spaced parameters, so the
+    points are z = 1 - y ** 2 at evenly spaced y.
+
+    Parameters:
+    segments (int): The number of segments per half of the parabola.
+
+    Returns:
+    numpy.ndarray: The 2 * segments + 1 (x, y, z) points, sorted along the y-axis.
+
+    """
+    points = np.zeros((2 * int(segments) + 1, 3))
+    points[:, 1] = np.linspace(-1.0, 1.0, points.shape[0])
+    points[:, 2] = 1 - points[:, 1] ** 2
+    return points
+
+@lru_cache(maxsize=ARC_TEMPLATE_CACHE_SIZE)
+def arc_template(segments: int, y_angle: float, z_scale: float, legacy: bool = False, profile: str = 'circle') -> np.ndarray:
+    """
+    Create the unit arc shared by all lines with the same parameters.
+
+    The arc spans from (0, -1, 0) to (0, 1, 0) in local coordinates, leaning
+    by the y-angle and scaled along the z-axis, so the z-scale sets the
+    height of the apex in units of half the length of the line. The results
+    are kept in a bounded LRU cache, see arc_template.cache_info() for its
+    hit rate.
+
+    Parameters:
+    segments (int): The number of segments per quarter of the circle.
+    y_angle (float): The angle of rotation around the y-axis in degrees.
+    z_scale (float): The scaling factor along the z-axis.
+    legacy (bool): Build the arc exactly as earlier versions of the plugin did,
+        it only changes the circle profile.
+    profile (str): The shape of the arc, one of ARC_PROFILES.
+
+    Returns:
+    numpy.ndarray: The read-only 2 * segments + 1 (x, y, z) local points.
+
+    """
+    if profile == 'circle':
+        points = _half_circle(segments, legacy)
+    elif profile == 'parabola':
+        points = _parabola(segments)
+    else:
+        raise ValueError(f"Unknown arc profile {profile!r}, expected one of {', '.join(ARC_PROFILES)}")
+    template = points @ rotation_y(np.radians(y_angle - 90))[:3, :3] @ scale_z(z_scale)[:3, :3]
+    template.flags.writeable = False
+    return template
+
+def template_cache_report(previous_info) -> str:
+    """
+    Describe the use of the arc template cache since an earlier snapshot.
+
+    Parameters:
+    previous_info (functools._CacheInfo): The arc_template.cache_info() taken before the run.
+
+    Returns:
+    str: The number of hits and misses and the hit rate.
+
+    """
+    current_info = arc_template.cache_info()
+    hits = current_info.hits - previous_info.hits
+    misses = current_info.misses - previous_info.misses
+    hit_rate = 100.0 * hits / (hits + misses) if hits + misses else 0.0
+    return f"Arc template cache: {hits} hits, {misses} misses ({hit_rate:.1f}% hit rate)"
+
+def arc_affine_transforms(starts: np.ndarray, ends: np.ndarray, legacy: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compose the placement of each unit arc template into one linear part and offset.
+
+    This is the product of the z-axis rotation towards the bearing and the
+    scaling by the radius, followed by the translation to the line, for row
+    vectors: p' = p @ linear + offset.
+
+    Parameters:
+    starts (numpy.ndarray): The (N, 2) start coordinates of the lines.
+    ends (numpy.ndarray): The (N, 2) end coordinates of the lines.
+    legacy (bool): Truncate the radius to whole units and anchor the arcs on
+        their end point, as earlier versions of the plugin did.
+
+    Returns:
+    Tuple[numpy.ndarray, numpy.ndarray]: The (N, 3, 3) linear parts and the (N, 3) offsets.
+
+    """
+    count = starts.shape[0]
+
+    # Half of the vector pointing from the end point towards the start point
+    # holds the radius times the sine and cosine of the bearing
+    half_delta = (starts - ends) / 2
+    radius = np.hypot(half_delta[:, 0], half_delta[:, 1])
+    if legacy:
+        whole_radius = np.trunc(radius)
+        half_delta *= np.divide(whole_radius, radius, out=np.zeros(count), where=radius > 0)[:, None]
+        radius = whole_radius
+    radius_sin, radius_cos = half_delta[:, 0], half_delta[:, 1]
+
+    linear = np.zeros((count, 3, 3))
+    linear[:, 0, 0] = radius_cos
+    linear[:, 0, 1] = -radius_sin
+    linear[:, 1, 0] = radius_sin
+    linear[:, 1, 1] = radius_cos
+    linear[:, 2, 2] = radius
+
+    offset = np.zeros((count, 3))
+    if legacy:
+        # The first vertex of the template, (0, -1, 0), lands on the end point
+        offset[:, :2] = ends + half_delta
+    else:
+        offset[:, :2] = (starts + ends) / 2
+    return linear, offset
+
+def arc_offsets(segments, count: int) -> np.ndarray:
+    """
+    Compute where each arc starts in the vertex buffer of a batch.
+
+    Parameters:
+    segments (int or numpy.ndarray): The number of segments, scalar or one per line.
+    count (int): The number of lines.
+
+    Returns:
+    numpy.ndarray: The N + 1 offsets, arc i being vertices[offsets[i]:offsets[i + 1]].
+
+    """
+    segments = np.broadcast_to(np.asarray(segments).astype(int), (count,))
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(2 * segments + 1, out=offsets[1:])
+    return offsets
+
+def _unwrap_longitudes(longitudes: np.ndarray, offsets: np.ndarray) -> None:
+    """
+    Remove the 360 degree jumps of arcs crossing the antimeridian, in place.
+
+    Each arc keeps the longitude of its first vertex, the next ones are
+    moved by whole turns so no step is longer than 180 degrees. Arcs crossing
+    the antimeridian then end beyond -180 or 180 degrees instead of jumping
+    across the whole map.
+
+    Parameters:
+    longitudes (numpy.ndarray): The M longitudes of all the arcs in degrees.
+    offsets (numpy.ndarray): The N + 1 offsets of the arcs into the longitudes.
+
+    """
+    if longitudes.size < 2:
+        return
+    turns = np.zeros(longitudes.size)
+    np.cumsum(-np.round(np.diff(longitudes) / 360.0), out=turns[1:])
+    # Count the turns from the first vertex of each arc
+    first_vertices = np.repeat(offsets[:-1], np.diff(offsets))
+    longitudes += 360.0 * (turns - turns[first_vertices])
+
+def generate_3d_arcs_great_circle(starts: np.ndarray, ends: np.ndarray, segments, y_angle, z_scale, legacy: bool = False, out: Optional[np.ndarray] = None, profile: str = 'circle') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generate the vertices of many 3D arcs following great circles.
+
+    The unit arc templates give each vertex its fraction of the way along
+    the arc, its sideways lean and its height, in units of half the length
+    of the arc. The ground track is then interpolated along the great circle
+    between the endpoints (slerp), leaned sideways along the normal of its
+    plane, and lifted in meters, for all the arcs at once. Arcs crossing the
+    antimeridian go on beyond -180 or 180 degrees, so the start point can
+    come out a whole turn away from the input one, see _unwrap_longitudes.
+
+    Parameters:
+    starts (numpy.ndarray): The (N, 2) start longitudes and latitudes in degrees.
+    ends (numpy.ndarray): The (N, 2) end longitudes and latitudes in degrees.
+    segments (int or numpy.ndarray): The number of segments, scalar or one per line.
+    y_angle (float or numpy.ndarray): The angle of rotation around the y-axis in degrees, scalar or one per line.
+    z_scale (float or numpy.ndarray): The scaling factor along the z-axis, scalar or one per line.
+    legacy (bool): Use the arc templates of earlier versions of the plugin.
+    out (numpy.ndarray): A preallocated (M, 3) array receiving the vertices, see arc_offsets for its size.
+    profile (str): The shape of the arcs, see arc_template.
+
+    Returns:
+    Tuple[numpy.ndarray, numpy.ndarray]: The (M, 3) longitude, latitude and
+    height in meters of all the vertices, and the N + 1 offsets into them.
+
+    """
+    start_vectors = _unit_vectors(np.asarray(starts, dtype=float).reshape(-1, 2))
+    end_vectors = _unit_vectors(np.asarray(ends, dtype=float).reshape(-1, 2))
+    count = start_vectors.shape[0]
+
+    # Lines of length 2 along the y-axis get the templates as they are
+    unit_starts = np.tile([0.0, 1.0], (count, 1))
+    unit_ends = np.tile([0.0, -1.0], (count, 1))
+    vertices, offsets = generate_3d_arcs(unit_starts, unit_ends, segments, y_angle, z_scale, legacy, out, profile)
+
+    # The arcs run from their end point, along the plane of the great circle
+    normals = np.cross(end_vectors, start_vectors)
+    normal_norm = np.linalg.norm(normals, axis=1)
+    angles = np.arctan2(normal_norm, np.einsum('ij,ij->i', start_vectors, end_vectors))
+    # Any great circle will do between equal or antipodal points
+    degenerate = normal_norm < 1e-12
+    normals[degenerate] = np.cross(end_vectors[degenerate], [0.0, 0.0, 1.0])
+    still_degenerate = degenerate & (np.linalg.norm(normals, axis=1) < 1e-12)
+    normals[still_degenerate] = [0.0, 1.0, 0.0]
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+    tangents = np.cross(normals, end_vectors)
+
+    arcs = np.repeat(np.arange(count), np.diff(offsets))
+    half_angles = angles[arcs] / 2
+    along = (1 + vertices[:, 1]) * half_angles
+    lean = vertices[:, 0] * half_angles
+    points = np.cos(along)[:, None] * end_vectors[arcs] + np.sin(along)[:, None] * tangents[arcs]
+    # Leaning right of the way from the end point to the start point
+    points = np.cos(lean)[:, None] * points - np.sin(lean)[:, None] * normals[arcs]
+
+    vertices[:, 2] *= EARTH_RADIUS * half_angles
+    vertices[:, 0] = np.degrees(np.arctan2(points[:, 1], points[:, 0]))
+    vertices[:, 1] = np.degrees(np.arcsin(np.clip(points[:, 2], -1.0, 1.0)))
+    # Keep the endpoints exactly where they were
+    nonempty = offsets[1:] > offsets[:-1]
+    vertices[offsets[:-1][nonempty], :2] = np.asarray(ends, dtype=float).reshape(-1, 2)[nonempty]
+    vertices[offsets[1:][nonempty] - 1, :2] = np.asarray(starts, dtype=float).reshape(-1, 2)[nonempty]
+    _unwrap_longitudes(vertices[:, 0], offsets)
+    return vertices, offsets
+
+def chord_lengths(starts: np.ndarray, ends: np.ndarray, geographic: bool = False) -> np.ndarray:
+    """
+    Measure the straight distance between the endpoints of each line.
+
+    Parameters:
+    starts (numpy.ndarray): The (N, 2) start coordinates of the lines.
+    ends (numpy.ndarray): The (N, 2) end coordinates of the lines.
+    geographic (bool): The points are longitudes and latitudes, the great
+        circle distance in meters is returned instead.
+
+    Returns:
+    numpy.ndarray: The N lengths.
+
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    if geographic:
+        cosines = np.einsum('ij,ij->i', _unit_vectors(starts), _unit_vectors(ends))
+        return EARTH_RADIUS * np.arccos(np.clip(cosines, -1.0, 1.0))
+    return np.hypot(*(ends - starts).T)
+
+def mercator_lengths(lengths, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Stretch lengths measured on the ground to EPSG:3857, where the arcs are built by default.
+
+    Web Mercator stretches lengths by 1 / cos(latitude), which is
+    cosh(y / WEB_MERCATOR_RADIUS). It is taken at the midpoint of each chord.
+
+    Parameters:
+    lengths (float or numpy.ndarray): The lengths on the ground in meters, scalar or one per line.
+    starts (numpy.ndarray): The (N, 2) start coordinates of the lines in EPSG:3857.
+    ends (numpy.ndarray): The (N, 2) end coordinates of the lines in EPSG:3857.
+
+    Returns:
+    numpy.ndarray: The N lengths in EPSG:3857 units.
+
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    middle_y = (starts[:, 1] + ends[:, 1]) / 2
+    return np.asarray(lengths, dtype=float) * np.cosh(middle_y / WEB_MERCATOR_RADIUS)
+
+def adaptive_segments(lengths, z_scale, max_error: float, max_segments: int = ADAPTIVE_MAX_SEGMENTS, profile: str = 'circle') -> np.ndarray:
+    """
+    Choose the number of segments of each arc so it stays close to the true curve.
+
+    Each segment of a half circle of radius r spanning an angle t is at most
+    r * (1 - cos(t / 2)) away from the circle, its sagitta. The z-scale can
+    only stretch that distance when above 1, so the fewest segments per
+    quarter circle keeping it under the maximum error are used. Short arcs
+    get as few as 1 segment per quarter circle, 3 vertices in all. Each
+    segment of the parabola profile spans r / segments and is at most
+    r / (4 * segments ** 2) away from it.
+
+    Parameters:
+    lengths (float or numpy.ndarray): The length between the endpoints of each arc, see chord_lengths.
+    z_scale (float or numpy.ndarray): The scaling factor along the z-axis, scalar or one per arc.
+    max_error (float): The largest distance between an arc and its segments, in the units of the lengths.
+    max_segments (int): The largest number of segments per quarter circle,
+        longer arcs may then be further from the curve than the maximum error.
+    profile (str): The shape of the arcs, see arc_template.
+
+    Returns:
+    numpy.ndarray: The number of segments per quarter circle of each arc.
+
+    """
+    radius = np.atleast_1d(np.asarray(lengths, dtype=float) / 2 * np.maximum(1.0, np.abs(np.asarray(z_scale, dtype=float))))
+    relative_error = np.divide(max_error, radius, out=np.full(radius.shape, np.inf), where=radius > 0)
+    if profile == 'parabola':
+        segments = np.ceil(np.sqrt(np.divide(0.25, relative_error, out=np.full(radius.shape, np.inf), where=relative_error > 0)))
+        return np.clip(segments, 1, max_segments).astype(int)
+    # The largest half angle of a segment meeting the error, per arc
+    half_angle = np.arccos(np.clip(1 - relative_error, -1.0, 1.0))
+    segments = np.ceil(np.pi / 4 / np.maximum(half_angle, np.pi / 4 / max_segments))
+    return np.clip(segments, 1, max_segments).astype(int)
+
+def budget_segments(weights, budget: int) -> np.ndarray:
+    """
+    Share a total number of vertices between arcs, in proportion to their weights.
+
+    Each arc has 2 * segments + 1 vertices and at least 1 segment. The
+    segments left once every arc has its first one are shared out by
+    weight, and those lost to rounding go to the largest remainders (the
+    largest remainder method), so the arcs use up the whole budget. They
+    use one vertex less when the budget left after the first segments is odd.
+
+    Parameters:
+    weights (numpy.ndarray): The weight of each arc, e.g. its length, see
+        chord_lengths. Missing or infinite weights count as 0, all of them
+        weigh the same when none is above 0.
+    budget (int): The total number of vertices of the arcs.
+
+    Returns:
+    numpy.ndarray: The number of segments of each arc.
+
+    Raises:
+    ValueError: If the budget is below the 3 vertices of each arc.
+
+    """
+    weights = np.nan_to_num(np.atleast_1d(np.asarray(weights, dtype=float)), nan=0.0, posinf=0.0, neginf=0.0)
+    weights = np.maximum(weights, 0.0)
+    count = weights.size
+    if budget < 3 * count:
+        raise ValueError(f"A budget of {budget} vertices is below the 3 vertices of each of the {count} arcs")
+    extra = (int(budget) - 3 * count) // 2
+    total = weights.sum()
+    if total <= 0:
+        weights = np.ones(count)
+        total = float(count)
+    shares = extra * (weights / total)
+    segments = np.floor(shares).astype(np.int64)
+    left = extra - int(segments.sum())
+    if left > 0:
+        # Only the arcs with the largest remainders are needed, not their order
+        largest = np.argpartition(segments - shares, left - 1)[:left]
+        segments[largest] += 1
+    return segments + 1
+
+def arc_rows(starts: np.ndarray, ends: np.ndarray, segments, y_angle, z_scale) -> np.ndarray:
+    """
+    Gather what each arc is built from into one row.
+
+    Parameters:
+    starts (numpy.ndarray): The (N, 2) start coordinates of the lines.
+    ends (numpy.ndarray): The (N, 2) end coordinates of the lines.
+    segments (int or numpy.ndarray): The number of segments, scalar or one per line.
+    y_angle (float or numpy.ndarray): The angle of rotation around the y-axis in degrees, scalar or one per line.
+    z_scale (float or numpy.ndarray): The scaling factor along the z-axis, scalar or one per line.
+
+    Returns:
+    numpy.ndarray: The (N, 7) start, end, segments, y_angle and z_scale columns.
+
+    """
+    count = len(starts)
+    rows = np.empty((count, 7))
+    rows[:, 0:2] = starts
+    rows[:, 2:4] = ends
+    rows[:, 4] = np.broadcast_to(np.asarray(segments).astype(int), (count,))
+    rows[:, 5] = np.broadcast_to(np.asarray(y_angle, dtype=float), (count,))
+    rows[:, 6] = np.broadcast_to(np.asarray(z_scale, dtype=float), (count,))
+    return rows
+
+def unique_arcs(rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the distinct arcs of a batch, e.g. the departures of the same route.
+
+    Parameters:
+    rows (numpy.ndarray): The (N, 7) arcs, see arc_rows.
+
+    Returns:
+    Tuple[numpy.ndarray, numpy.ndarray]: The (K, 7) distinct arcs and the N
+    indexes of the distinct arc of each input arc.
+
+    """
+    if rows.shape[0] < 2:
+        return rows, np.arange(rows.shape[0])
+    distinct, inverse = np.unique(rows, axis=0, return_inverse=True)
+    return distinct, inverse.reshape(-1)
+
+def generate_3d_arcs(starts: np.ndarray, ends: np.ndarray, segments, y_angle, z_scale, legacy: bool = False, out: Optional[np.ndarray] = None, profile: str = 'circle') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generate the vertices of many 3D arcs at once.
+
+    Each arc runs from its end point to its start point, the vertex order
+    generate_3d_polyline_from_geometry has always produced.
+
+    Parameters:
+    starts (numpy.ndarray): The (N, 2) start coordinates of the lines.
+    ends (numpy.ndarray): The (N, 2) end coordinates of the lines.
+    segments (int or numpy.ndarray): The number of segments, scalar or one per line.
+    y_angle (float or numpy.ndarray): The angle of rotation around the y-axis in degrees, scalar or one per line.
+    z_scale (float or numpy.ndarray): The scaling factor along the z-axis, scalar or one per line.
+    legacy (bool): Build the arcs exactly as earlier versions of the plugin did.
+    out (numpy.ndarray): A preallocated (M, 3) array receiving the vertices,
+        e.g. a view on shared memory, see arc_offsets for its size.
+    profile (str): The shape of the arcs, one of ARC_PROFILES, see arc_template.
+
+    Returns:
+    Tuple[numpy.ndarray, numpy.ndarray]: The (M, 3) vertices of all the arcs and
+    the N + 1 offsets into them, arc i being vertices[offsets[i]:offsets[i + 1]].
+
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    count = starts.shape[0]
+    segments = np.broadcast_to(np.asarray(segments).astype(int), (count,))
+    y_angle = np.broadcast_to(np.asarray(y_angle, dtype=float), (count,))
+    z_scale = np.broadcast_to(np.asarray(z_scale, dtype=float), (count,))
+
+    offsets = arc_offsets(segments, count)
+    vertices = np.empty((offsets[-1], 3)) if out is None else out
+
+    linear, offset = arc_affine_transforms(starts, ends, legacy)
+    # Lines sharing the same parameters share the same template
+    parameters, groups = np.unique(np.column_stack([segments, y_angle, z_scale]), axis=0, return_inverse=True)
+    order = np.argsort(groups.reshape(-1), kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(groups.reshape(-1), minlength=len(parameters)))])
+    for group, (segment_count, group_y_angle, group_z_scale) in enumerate(parameters):
+        rows = order[bounds[group]:bounds[group + 1]]
+        template = arc_template(int(segment_count), float(group_y_angle), float(group_z_scale), legacy, profile)
+        indices = offsets[rows, None] + np.arange(template.shape[0])
+        vertices[indices] = np.einsum('kj,nji->nki', template, linear[rows]) + offset[rows, None, :]
+    return vertices, offsets
+
+def _unit_vectors(lon_lat: np.ndarray) -> np.ndarray:
+    """
+    Convert longitudes and latitudes to directions from the center of the earth.
+
+    Parameters:
+    lon_lat (numpy.ndarray): The (N, 2) longitudes and latitudes in degrees.
+
+    Returns:
+    numpy.ndarray: The (N, 3) unit vectors.
+
+    """
+    lon, lat = np.radians(lon_lat[:, 0]), np.radians(lon_lat[:, 1])
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def generate_3d_arcs_geographic(starts: np.ndarray, ends: np.ndarray, segments, y_angle, z_scale, legacy: bool = False, out: Optional[np.ndarray] = None, profile: str = 'circle') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generate the vertices of many 3D arcs from longitudes and latitudes.
+
+    Each arc is built in meters on the plane touching the globe at its
+    midpoint, using the azimuthal equidistant projection. It keeps the
+    distances and directions from the midpoint, so the endpoints lie on a
+    straight line through it, half the length of the great circle away on
+    either side, and the ground track of the arc follows the great circle
+    between its endpoints however long it is. Antipodal endpoints have no
+    midpoint to build the plane on, their arcs are built by
+    generate_3d_arcs_great_circle instead. Arcs crossing the antimeridian go
+    on beyond -180 or 180 degrees, see _unwrap_longitudes.
+
+    Parameters:
+    starts (numpy.ndarray): The (N, 2) start longitudes and latitudes in degrees.
+    ends (numpy.ndarray): The (N, 2) end longitudes and latitudes in degrees.
+    segments (int or numpy.ndarray): The number of segments, scalar or one per line.
+    y_angle (float or numpy.ndarray): The angle of rotation around the y-axis in degrees, scalar or one per line.
+    z_scale (float or numpy.ndarray): The scaling factor along the z-axis, scalar or one per line.
+    legacy (bool): Build the arcs exactly as earlier versions of the plugin did.
+    out (numpy.ndarray): A preallocated (M, 3) array receiving the vertices, see arc_offsets for its size.
+    profile (str): The shape of the arcs, see arc_template.
+
+    Returns:
+    Tuple[numpy.ndarray, numpy.ndarray]: The (M, 3) longitude, latitude and
+    height in meters of all the vertices, and the N + 1 offsets into them.
+
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    start_vectors = _unit_vectors(starts)
+    end_vectors = _unit_vectors(ends)
+
+    # Local frame touching the globe at the midpoint of each arc
+    centers = start_vectors + end_vectors
+    center_norm = np.linalg.norm(centers, axis=1)
+    # Any finite frame will do for antipodal endpoints, their arcs are replaced below
+    antipodal = center_norm < 1e-9
+    centers[antipodal] = start_vectors[antipodal]
+    center_norm[antipodal] = 1.0
+    centers /= center_norm[:, None]
+    east = np.cross([0.0, 0.0, 1.0], centers)
+    east_norm = np.linalg.norm(east, axis=1)
+    # Any horizontal direction will do for an arc centered on a pole
+    polar = east_norm < 1e-12
+    east[polar] = [0.0, 1.0, 0.0]
+    east_norm[polar] = 1.0
+    east /= east_norm[:, None]
+    north = np.cross(centers, east)
+
+    def to_plane(vectors):
+        x = np.einsum('ij,ij->i', vectors, east)
+        y = np.einsum('ij,ij->i', vectors, north)
+        sine = np.hypot(x, y)
+        # The great circle distance from the midpoint along the direction of the point
+        distance = np.arctan2(sine, np.einsum('ij,ij->i', vectors, centers))
+        scale = EARTH_RADIUS * np.divide(distance, sine, out=np.zeros_like(sine), where=sine > 0)
+        return np.column_stack([x * scale, y * scale])
+
+    vertices, offsets = generate_3d_arcs(to_plane(start_vectors), to_plane(end_vectors), segments, y_angle, z_scale, legacy, out, profile)
+
+    # Back from the planes to the globe, walking the distance from the midpoint
+    arcs = np.repeat(np.arange(centers.shape[0]), np.diff(offsets))
+    distances = np.hypot(vertices[:, 0], vertices[:, 1])
+    angles = distances / EARTH_RADIUS
+    scale = np.divide(np.sin(angles), distances, out=np.zeros_like(distances), where=distances > 0)
+    directions = (np.cos(angles)[:, None] * centers[arcs]
+                  + (vertices[:, :1] * scale[:, None]) * east[arcs]
+                  + (vertices[:, 1:2] * scale[:, None]) * north[arcs])
+    vertices[:, 0] = np.degrees(np.arctan2(directions[:, 1], directions[:, 0]))
+    vertices[:, 1] = np.degrees(np.arcsin(np.clip(directions[:, 2], -1.0, 1.0)))
+    # Keep the endpoints exactly where they were
+    nonempty = offsets[1:] > offsets[:-1]
+    vertices[offsets[:-1][nonempty], :2] = ends[nonempty]
+    vertices[offsets[1:][nonempty] - 1, :2] = starts[nonempty]
+    if antipodal.any():
+        rows = np.flatnonzero(antipodal)
+        count = centers.shape[0]
+        antipodal_vertices, _ = generate_3d_arcs_great_circle(
+            starts[rows], ends[rows],
+            np.broadcast_to(np.asarray(segments).astype(int), (count,))[rows],
+            np.broadcast_to(np.asarray(y_angle, dtype=float), (count,))[rows],
+            np.broadcast_to(np.asarray(z_scale, dtype=float), (count,))[rows],
+            legacy, profile=profile,
+        )
+        vertices[np.concatenate([np.arange(offsets[row], offsets[row + 1]) for row in rows])] = antipodal_vertices
+    _unwrap_longitudes(vertices[:, 0], offsets)
+    return vertices, offsets
+
+def linestring_z_wkb(vertices: np.ndarray, offsets: np.ndarray) -> List[bytes]:
+    """
+    Encode arcs as little endian ISO WKB LineStringZ records.
+
+    Arcs with the same number of vertices are packed into one contiguous
+    buffer of fixed size records, which is then sliced per arc.
+
+    Parameters:
+    vertices (numpy.ndarray): The (M, 3) vertices of all the arcs.
+    offsets (numpy.ndarray): The N + 1 offsets of the arcs into the vertices.
+
+    Returns:
+    List[bytes]: The WKB of each arc, in the order of the offsets.
+
+    """
+    counts = np.diff(offsets)
+    records = [None] * counts.size
+    for count in np.unique(counts):
+        rows = np.flatnonzero(counts == count)
+        record_type = np.dtype([
+            ('byte_order', 'u1'),
+            ('wkb_type', '<u4'),
+            ('num_points', '<u4'),
+            ('coordinates', '<f8', (count, 3)),
+        ])
+        buffer = np.empty(rows.size, dtype=record_type)
+        buffer['byte_order'] = 1
+        buffer['wkb_type'] = WKB_LINESTRING_Z
+        buffer['num_points'] = count
+        buffer['coordinates'] = vertices[offsets[rows, None] + np.arange(count)]
+        data = buffer.tobytes()
+        size = record_type.itemsize
+        for index, row in enumerate(rows):
+            records[row] = data[index * size:(index + 1) * size]
+    return records
+
+def linestring_z_vertices(records: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decode little endian ISO WKB LineStringZ records, the inverse of linestring_z_wkb.
+
+    Parameters:
+    records (List[bytes]): The WKB of each arc.
+
+    Returns:
+    Tuple[numpy.ndarray, numpy.ndarray]: The (M, 3) vertices of all the arcs and the N + 1 offsets into them.
+
+    """
+    # The coordinates follow the byte order, the type and the number of points
+    coordinates = [np.frombuffer(record, dtype='<f8', offset=9).reshape(-1, 3) for record in records]
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    np.cumsum([len(points) for points in coordinates], out=offsets[1:])
+    vertices = np.concatenate(coordinates) if coordinates else np.empty((0, 3))
+    return vertices, offsets
+
+def arc_vertices(starts: np.ndarray, ends: np.ndarray, segments, y_angle, z_scale, legacy: bool = False, geographic: bool = False, out: Optional[np.ndarray] = None, great_circle: bool = False, profile: str = 'circle') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generate the vertices of a chunk of arcs from plain arrays.
+
+    Parameters:
+    starts (numpy.ndarray): The (N, 2) start coordinates of the lines.
+    ends (numpy.ndarray): The (N, 2) end coordinates of the lines.
+    segments (int or numpy.ndarray): The number of segments, scalar or one per line.
+    y_angle (float or numpy.ndarray): The angle of rotation around the y-axis in degrees, scalar or one per line.
+    z_scale (float or numpy.ndarray): The scaling factor along the z-axis, scalar or one per line.
+    legacy (bool): Build the arcs exactly as earlier versions of the plugin did.
+    geographic (bool): The points are longitudes and latitudes, see generate_3d_arcs_geographic.
+    out (numpy.ndarray): A preallocated (M, 3) array receiving the vertices.
+    great_circle (bool): The points are longitudes and latitudes, see generate_3d_arcs_great_circle.
+    profile (str): The shape of the arcs, see arc_template.
+
+    Returns:
+    Tuple[numpy.ndarray, numpy.ndarray]: The (M, 3) vertices and the N + 1 offsets into them.
+
+    """
+    if great_circle:
+        return generate_3d_arcs_great_circle(starts, ends, segments, y_angle, z_scale, legacy, out, profile)
+    if geographic:
+        return generate_3d_arcs_geographic(starts, ends, segments, y_angle, z_scale, legacy, out, profile)
+    return generate_3d_arcs(starts, ends, segments, y_angle, z_scale, legacy, out, profile)
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to a shared memory block created by another process.
+
+    Parameters:
+    name (str): The name of the block.
+
+    Returns:
+    multiprocessing.shared_memory.SharedMemory: The block, to be closed but not unlinked.
+
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Spawned workers share the resource tracker of the process that created
+    # the block, registering it again is harmless and it is unlinked there
+    return shared_memory.SharedMemory(name=name)
+
+def arc_vertices_shared(inputs_name: str, vertices_name: str, count: int, vertex_count: int, legacy: bool = False, geographic: bool = False, great_circle: bool = False, profile: str = 'circle') -> None:
+    """
+    Generate the vertices of a chunk of arcs between shared memory blocks.
+
+    It runs in a worker process: the endpoints and parameters are read from
+    one block and the vertices are written in place into the other, so no
+    coordinates are pickled in either direction.
+
+    Parameters:
+    inputs_name (str): The block holding the (N, 7) start, end, segments, y_angle and z_scale columns.
+    vertices_name (str): The block receiving the (M, 3) vertices.
+    count (int): The number of arcs N.
+    vertex_count (int): The number of vertices M, see arc_offsets.
+    legacy (bool): Build the arcs exactly as earlier versions of the plugin did.
+    geographic (bool): The points are longitudes and latitudes, see generate_3d_arcs_geographic.
+    great_circle (bool): The points are longitudes and latitudes, see generate_3d_arcs_great_circle.
+    profile (str): The shape of the arcs, see arc_template.
+
+    """
+    inputs_block = _attach_shared_memory(inputs_name)
+    vertices_block = _attach_shared_memory(vertices_name)
+    try:
+        inputs = np.ndarray((count, 7), buffer=inputs_block.buf)
+        vertices = np.ndarray((vertex_count, 3), buffer=vertices_block.buf)
+        arc_vertices(inputs[:, 0:2], inputs[:, 2:4], inputs[:, 4], inputs[:, 5], inputs[:, 6], legacy, geographic, vertices, great_circle, profile)
+        # The views have to be released before the blocks can be closed
+        del inputs, vertices
+    finally:
+        inputs_block.close()
+        vertices_block.close()
+
+def benchmark_arcs(count: int = 100000, segments: int = 10, y_angle: float = 90, z_scale: float = 0.5, geographic: bool = False, repeat: int = 5, great_circle: bool = False, profile: str = 'circle') -> dict:
+    """
+    Time the arc kernel on random lines.
+
+    Parameters:
+    count (int): The number of lines.
+    segments (int): The number of segments to divide the arcs into.
+    y_angle (float): The angle of rotation around the y-axis.
+    z_scale (float): The scaling factor along the z-axis.
+    geographic (bool): Use longitudes and latitudes, see generate_3d_arcs_geographic.
+    repeat (int): The number of runs, the fastest one is kept.
+    great_circle (bool): Use longitudes and latitudes, see generate_3d_arcs_great_circle.
+    profile (str): The shape of the arcs, see arc_template.
+
+    Returns:
+    dict: The number of lines and vertices, the seconds of the fastest run and the arcs per second.
+
+    """
+    generator = np.random.default_rng(0)
+    if geographic or great_circle:
+        starts = generator.uniform([-180, -80], [180, 80], (count, 2))
+        ends = generator.uniform([-180, -80], [180, 80], (count, 2))
+    else:
+        starts = generator.uniform(-1e6, 1e6, (count, 2))
+        ends = generator.uniform(-1e6, 1e6, (count, 2))
+    seconds = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        vertices, _ = arc_vertices(starts, ends, segments, y_angle, z_scale, geographic=geographic, great_circle=great_circle, profile=profile)
+        seconds = min(seconds, time.perf_counter() - start_time)
+    return {
+        'arcs': count,
+        'vertices': vertices.shape[0],
+        'seconds': seconds,
+        'arcs_per_second': count / seconds if seconds else float('inf'),
+    }
+
+if __name__ == '__main__':
+    print(benchmark_arcs())
@@ -0,0 +1,163 @@
+"""
+A 3D arc layer kept in sync with the edits of its source layer.
+
+Run it from the QGIS Python console, keeping a reference to the object:
+
+    live = LiveArcLayer(iface.activeLayer(), 10, 90, 0.5)
+    QgsProject.instance().addMapLayer(live.layer_3d)
+"""
+from typing import Iterable, List, Optional
+
+from qgis.core import QgsVectorLayer
+from qgis.PyQt.QtCore import QObject, QTimer
+
+from .arc_3d_methods import (DEFAULT_BATCH_SIZE, attribute_subset_request, create_3d_empty_layer_from_layer, feature_endpoint_chunks,
+                             generate_3d_polyline_chunks, new_3d_arc_features, transform_to_3d_crs)
+
+# Milliseconds without edits before the touched arcs are rebuilt
+LIVE_UPDATE_DELAY = 500
+
+
+class LiveArcLayer(QObject):
+    """
+    Keep a LineStringZ arc layer in sync with a source line layer.
+
+    The arcs of the whole layer are built once, then the edit signals of the
+    source collect the IDs of the touched features. Once the edits pause for
+    `delay` milliseconds, or DEFAULT_BATCH_SIZE features are waiting, only
+    their arcs are deleted and rebuilt in one batch.
+
+    Parameters:
+    layer (QgsVectorLayer): The source line layer.
+    segments (int): The number of segments to divide the arcs into.
+    y_angle (float): The angle of rotation around the y-axis.
+    z_scale (float): The scaling factor along the z-axis.
+    legacy (bool): Build the arcs exactly as earlier versions of the plugin did.
+    native_crs (bool): Build the arcs in the CRS of the input layer instead of EPSG:3857.
+    field_names (List[str]): The names of the fields copied to the arcs, all of them if empty or None.
+    max_error (float): Above 0, choose the segments of each arc from its chord
+        length instead, so it stays within this distance of the true curve.
+    delay (int): The milliseconds without edits before the arcs are rebuilt.
+
+    """
+
+    def __init__(self, layer: QgsVectorLayer, segments: int, y_angle: float, z_scale: float, legacy: bool = False, native_crs: bool = False, field_names: Optional[List[str]] = None, max_error: float = 0.0, delay: int = LIVE_UPDATE_DELAY):
+        super().__init__()
+        self.layer = layer
+        self.parameters = (segments, y_angle, z_scale)
+        self.legacy = legacy
+        self.geographic = native_crs and layer.crs().isGeographic()
+        self.transform = None if native_crs else transform_to_3d_crs(layer.crs())
+        self.field_names = field_names
+        self.max_error = max_error
+        self.layer_3d = create_3d_empty_layer_from_layer(layer, layer.crs() if native_crs else None, field_names)
+        # The arc of each source feature, by feature ID
+        self.arc_ids = {}
+        self.pending = set()
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.flush)
+
+        self._connections = [
+            (layer.featureAdded, self._touch),
+            (layer.featureDeleted, self._touch),
+            (layer.geometryChanged, self._geometry_changed),
+            (layer.attributeValueChanged, self._attribute_value_changed),
+            (layer.committedFeaturesAdded, self._committed_features_added),
+            (layer.afterRollBack, self.rebuild),
+            (layer.willBeDeleted, self.stop),
+            (self.layer_3d.willBeDeleted, self.stop),
+        ]
+        for signal, slot in self._connections:
+            signal.connect(slot)
+
+        self.rebuild()
+
+    def _touch(self, fid: int) -> None:
+        self.pending.add(fid)
+        if len(self.pending) >= DEFAULT_BATCH_SIZE:
+            self.flush()
+        else:
+            # Restart the countdown, so a burst of edits is handled at once
+            self.timer.start()
+
+    def _geometry_changed(self, fid: int, geometry_) -> None:
+        self._touch(fid)
+
+    def _attribute_value_changed(self, fid: int, index: int, value) -> None:
+        self._touch(fid)
+
+    def _committed_features_added(self, layer_id: str, features) -> None:
+        # Committing gives the added features their final IDs, the arcs of
+        # the temporary negative ones are replaced
+        for fid in list(self.arc_ids):
+            if fid < 0:
+                self.pending.add(fid)
+        for feature in features:
+            self.pending.add(feature.id())
+        self.timer.start()
+
+    def flush(self) -> None:
+        """
+        Rebuild the arcs of the features edited since the last update.
+
+        """
+        self.timer.stop()
+        if not self.pending:
+            return
+        fids, self.pending = self.pending, set()
+        self.update_arcs(fids)
+
+    def rebuild(self) -> None:
+        """
+        Rebuild the arcs of the whole source layer.
+
+        """
+        self.timer.stop()
+        self.pending = set()
+        self.layer_3d.dataProvider().truncate()
+        self.arc_ids = {}
+        self.update_arcs(None)
+
+    def update_arcs(self, fids: Optional[Iterable[int]]) -> None:
+        """
+        Replace the arcs of some source features.
+
+        The arcs of features that no longer exist are deleted.
+
+        Parameters:
+        fids (Iterable[int]): The IDs of the source features, None for all of them.
+
+        """
+        provider = self.layer_3d.dataProvider()
+        request = attribute_subset_request(self.layer.fields(), self.field_names)
+        if fids is not None:
+            fids = list(fids)
+            provider.deleteFeatures([self.arc_ids.pop(fid) for fid in fids if fid in self.arc_ids])
+            request.setFilterFids(fids)
+
+        # The source layer also returns the features of its edit buffer
+        chunks = feature_endpoint_chunks(self.layer.getFeatures(request), DEFAULT_BATCH_SIZE, self.transform)
+        for features, _, polylines_3d in generate_3d_polyline_chunks(chunks, lambda features: self.parameters, legacy=self.legacy, geographic=self.geographic, max_error=self.max_error):
+            _, added = provider.addFeatures(new_3d_arc_features(self.layer_3d, polylines_3d, features))
+            for feature, arc in zip(features, added):
+                self.arc_ids[feature.id()] = arc.id()
+
+        self.layer_3d.updateExtents()
+        self.layer_3d.triggerRepaint()
+
+    def stop(self) -> None:
+        """
+        Stop following the edits of the source layer.
+
+        """
+        self.timer.stop()
+        for signal, slot in self._connections:
+            try:
+                signal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                # Already disconnected, or the layer is gone
+                pass
+        self._connections = []
@@ -1,121 +1,760 @@
 # Import necessary QGIS modules
-from qgis.core import QgsProject, QgsGeometry, QgsVectorLayer, QgsField, QgsFeature, QgsPoint, QgsPointXY, QgsCoordinateTransform, QgsCoordinateReferenceSystem
+import multiprocessing
+import multiprocessing.spawn
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from multiprocessing import shared_memory
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from qgis.core import QgsApplication, QgsProject, QgsTask, QgsGeometry, QgsVectorLayer, QgsField, QgsFields, QgsFeature, QgsFeatureRequest, QgsFeatureSink, QgsProcessingException, QgsProcessingLayerPostProcessorInterface, QgsRuleBasedRenderer, QgsSymbol, QgsLineString, QgsRectangle, QgsVectorLayerFeatureSource, QgsWkbTypes, QgsCoordinateTransform, QgsCoordinateReferenceSystem
 from qgis.PyQt.QtCore import QVariant
 import numpy as np
 
+from .arc_3d_cache import ArcCache
+# The arc math lives in arc_3d_engine, its names are also imported from here by the
+# algorithms and by scripts written against earlier versions, unused ones included
+from .arc_3d_engine import (ARC_PROFILES, ARC_TEMPLATE_CACHE_SIZE, EARTH_RADIUS, WKB_LINESTRING_Z, adaptive_segments, arc_offsets, arc_rows, arc_template, arc_vertices,
+                            arc_vertices_shared, budget_segments, chord_lengths, mercator_lengths, generate_3d_arcs, generate_3d_arcs_geographic, linestring_z_vertices, linestring_z_wkb,
+                            rotation_x, rotation_y, rotation_z, scale_z, template_cache_report, translate, unique_arcs)
+
 EPSG_3D_CODE = 3857
+# CRS great circle arcs are built in
+EPSG_LON_LAT_CODE = 4326
+# Number of features handed to the arc kernel at once
+DEFAULT_BATCH_SIZE = 5000
+# Field holding the number of segments of each level of detail
+LOD_FIELD = 'lod'
+# Scale denominator below which the second coarsest level of detail is drawn,
+# each finer level takes over at a scale ten times larger
+LOD_SCALE = 5000000
+# Number of transformed endpoints kept between chunks
+TRANSFORM_CACHE_SIZE = 1000000
+# Seconds and features between two progress updates and cancellation checks
+PROGRESS_INTERVAL = 0.2
+PROGRESS_FEATURES = 50000
+# Seconds between two throughput reports
+THROUGHPUT_INTERVAL = 10.0
 
-def rotation_x(rad_angle):
+def kept_fields(fields: QgsFields, field_names: Optional[List[str]] = None) -> QgsFields:
     """
-    Perform a rotation around the x-axis.
+    Select the fields copied to the 3D arcs.
 
     Parameters:
-    rad_angle (float): The angle of rotation in radians.
+    fields (QgsFields): The fields of the input layer.
+    field_names (List[str]): The names of the fields to keep, all of them if empty or None.
 
     Returns:
-    numpy.ndarray: The rotation matrix.
+    QgsFields: The kept fields, in the order of the input layer.
+
+    """
+    if not field_names:
+        return fields
+    kept = QgsFields()
+    for field in fields:
+        if field.name() in field_names:
+            kept.append(field)
+    return kept
 
+def attribute_subset_request(fields: QgsFields, field_names: Optional[List[str]] = None) -> QgsFeatureRequest:
     """
-    return np.array([
-        [1, 0, 0, 0],
-        [0, np.cos(rad_angle), -np.sin(rad_angle), 0],
-        [0, np.sin(rad_angle), np.cos(rad_angle), 0],
-        [0, 0, 0, 1]
-    ])
+    Create a feature request reading only some of the attributes.
+
+    The other attributes are never fetched from the data provider, they are
+    left empty in the features.
+
+    Parameters:
+    fields (QgsFields): The fields of the input layer.
+    field_names (List[str]): The names of the fields to read, all of them if empty or None.
+
+    Returns:
+    QgsFeatureRequest: The feature request.
 
+    """
+    request = QgsFeatureRequest()
+    if field_names:
+        request.setSubsetOfAttributes(list(field_names), fields)
+    return request
 
-def rotation_y(rad_angle):
+def keep_attributes(features: List[QgsFeature], fields: QgsFields) -> List[QgsFeature]:
     """
-    Perform a rotation around the y-axis.
+    Reduce features read with attribute_subset_request to the kept fields, in place.
 
     Parameters:
-    rad_angle (float): The angle of rotation in radians.
+    features (List[QgsFeature]): The features, all with the fields of the input layer.
+    fields (QgsFields): The kept fields, see kept_fields.
 
     Returns:
-    numpy.ndarray: The rotation matrix.
+    List[QgsFeature]: The same features, now holding only the kept fields.
 
     """
-    return np.array([
-        [np.cos(rad_angle), 0, np.sin(rad_angle), 0],
-        [0, 1, 0, 0],
-        [-np.sin(rad_angle), 0, np.cos(rad_angle), 0],
-        [0, 0, 0, 1]
-    ])
+    if not features:
+        return features
+    # Look up the attribute indexes once for the whole batch
+    field_indexes = [features[0].fields().lookupField(field_name) for field_name in fields.names()]
+    for feature in features:
+        attributes_ = feature.attributes()
+        feature.setFields(fields, False)
+        feature.setAttributes([attributes_[index] for index in field_indexes])
+    return features
 
-def rotation_z(rad_angle):
+def create_3d_empty_layer_from_layer(layer, crs: Optional[QgsCoordinateReferenceSystem] = None, field_names: Optional[List[str]] = None):
     """
-    Perform a rotation around the z-axis.
+    Create a 3D empty layer from an existing layer.
 
     Parameters:
-    rad_angle (float): The angle of rotation in radians.
+    layer (QgsVectorLayer): The input layer.
+    crs (QgsCoordinateReferenceSystem): The CRS of the 3D layer, EPSG:3857 if None.
+    field_names (List[str]): The names of the fields to keep, all of them if empty or None.
 
     Returns:
-    numpy.ndarray: The rotation matrix.
+    QgsVectorLayer: The 3D empty layer.
 
     """
-    return np.array([
-        [np.cos(rad_angle), -np.sin(rad_angle), 0, 0],
-        [np.sin(rad_angle), np.cos(rad_angle), 0, 0],
-        [0, 0, 1, 0],
-        [0, 0, 0, 1]
-    ])
+    # Create a memory vector layer to store the 3D polyline
+    crs_uri = crs.authid() if crs is not None else f"EPSG:{EPSG_3D_CODE}"
+    layer_3d = QgsVectorLayer(f"LineStringZ?crs={crs_uri}", layer.name(), "memory")
+    provider = layer_3d.dataProvider()
+    provider.addAttributes([QgsField(field.name(), field.type()) for field in kept_fields(layer.fields(), field_names)])
+    layer_3d.updateFields()
+    return layer_3d
 
-def scale_z(scale_: float) -> np.ndarray:
+class ProgressReporter:
     """
-    Perform a scaling along the z-axis.
+    Report the progress of a run at a bounded rate.
+
+    Updating the progress bar goes through Qt signals, so it is done at most
+    once per interval of time or number of features, whichever comes first,
+    and so is the cancellation check. The throughput and the remaining time
+    are logged now and then through feedback.pushInfo, when the feedback has it.
 
     Parameters:
-    scale_ (float): The scaling factor.
+    feedback (QgsFeedback or QgsTask): Receives the progress and is checked for cancellation.
+    total (int): The number of features to process, 0 if unknown.
+    interval (float): The minimum number of seconds between two updates.
+    features (int): The number of features after which an update is due anyway.
+    info_interval (float): The minimum number of seconds between two throughput reports.
+
+    """
+
+    def __init__(self, feedback, total: int, interval: float = PROGRESS_INTERVAL, features: int = PROGRESS_FEATURES, info_interval: float = THROUGHPUT_INTERVAL):
+        self.feedback = feedback
+        self.total = total
+        self.interval = interval
+        self.features = features
+        self.info_interval = info_interval
+        self.current = 0
+        self.canceled = False
+        self.start_time = self.last_time = self.last_info_time = time.perf_counter()
+        self.last_current = 0
+
+    def _push_info(self, message: str) -> None:
+        if hasattr(self.feedback, 'pushInfo'):
+            self.feedback.pushInfo(message)
+
+    def throughput(self, now: float) -> str:
+        """
+        Describe the number of features processed so far, their rate and the remaining time.
+
+        Parameters:
+        now (float): The time.perf_counter() of the report.
+
+        Returns:
+        str: The description.
+
+        """
+        elapsed = now - self.start_time
+        rate = self.current / elapsed if elapsed > 0 else 0.0
+        message = f"{self.current} features in {elapsed:.1f} s ({rate:.0f} features/s)"
+        if rate and self.total > self.current:
+            message += f", about {(self.total - self.current) / rate:.0f} s left"
+        return message
+
+    def update(self, count: int) -> bool:
+        """
+        Count processed features, updating the progress when it is due.
+
+        Parameters:
+        count (int): The number of features processed since the last call.
+
+        Returns:
+        bool: Whether the run was canceled, as of the last check.
+
+        """
+        self.current += count
+        now = time.perf_counter()
+        if now - self.last_time < self.interval and self.current - self.last_current < self.features:
+            return self.canceled
+        self.last_time, self.last_current = now, self.current
+        if self.feedback is not None:
+            self.canceled = self.feedback.isCanceled()
+            if self.total:
+                self.feedback.setProgress(100.0 * self.current / self.total)
+            if now - self.last_info_time >= self.info_interval:
+                self.last_info_time = now
+                self._push_info(self.throughput(now))
+        return self.canceled
+
+    def finish(self) -> None:
+        """
+        Set the final progress and log the overall throughput.
+
+        """
+        if self.feedback is not None:
+            if self.total:
+                self.feedback.setProgress(100.0 * self.current / self.total)
+            self._push_info(self.throughput(time.perf_counter()))
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    """
+    Split an iterable, such as a feature iterator, into lists of a fixed size.
+
+    Parameters:
+    iterable (Iterable): The items to split.
+    size (int): The maximum number of items per chunk.
 
     Returns:
-    numpy.ndarray: The scaling matrix.
+    Iterator[list]: The chunks, the last one possibly shorter.
 
     """
-    return np.array([
-        [1, 0, 0, 0],
-        [0, 1, 0, 0],
-        [0, 0, scale_, 0],
-        [0, 0, 0, 1]
-    ])
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
-def translate(x: float, y: float) -> np.ndarray:
+def _is_python_interpreter(path: str) -> bool:
     """
-    Perform a translation in 3D space.
+    Tell whether a program is a Python interpreter, judging by its name.
 
     Parameters:
-    x (float): The translation distance along the x-axis.
-    y (float): The translation distance along the y-axis.
+    path (str): The path of the program.
 
     Returns:
-    numpy.ndarray: The translation matrix.
+    bool: True for python, python3, python3.12, python.exe and the like.
 
     """
-    return np.array([
-        [1, 0, 0, x],
-        [0, 1, 0, y],
-        [0, 0, 1, 0],
-        [0, 0, 0, 1]
-    ])
+    return os.path.basename(path).lower().startswith('python')
 
-def create_3d_empty_layer_from_layer(layer):
+def _python_executable() -> str:
     """
-    Create a 3D empty layer from an existing layer.
+    Find the Python interpreter to start worker processes with.
+
+    Inside QGIS sys.executable is the QGIS binary itself, so look for the
+    interpreter QGIS ships next to its Python installation.
+
+    Returns:
+    str: The path of the interpreter.
+
+    """
+    version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    candidates = [
+        sys.executable,
+        os.path.join(sys.exec_prefix, 'python.exe'),
+        os.path.join(sys.exec_prefix, 'bin', f'python{version}'),
+        os.path.join(sys.exec_prefix, 'bin', 'python3'),
+        os.path.join(os.path.dirname(sys.executable), 'bin', 'python3'),
+    ]
+    for candidate in candidates:
+        if _is_python_interpreter(candidate) and os.path.isfile(candidate):
+            return candidate
+    return shutil.which(f'python{version}') or shutil.which('python3') or sys.executable
+
+def ordered_parallel_map(function: Callable, items: Iterable[Tuple[Any, tuple]], workers: int = 1, processes: bool = False) -> Iterator[Tuple[Any, Any]]:
+    """
+    Apply a function on a pool of workers and yield the results in order.
+
+    The NumPy work of the arc kernel releases the GIL, so chunks of arcs can
+    be built side by side on threads while the caller keeps reading and
+    writing features. Worker processes avoid the GIL altogether, but then
+    the function and its arguments have to be picklable. At most two items
+    per worker are in flight at once, and the ones not started yet are
+    dropped when the caller stops iterating.
 
     Parameters:
-    layer (QgsVectorLayer): The input layer.
+    function (Callable): The function to call with the arguments of each item.
+    items (Iterable[Tuple[Any, tuple]]): Pairs of a key, e.g. a chunk of features, and the function arguments.
+    workers (int): The number of workers, 1 to run everything in the calling thread.
+    processes (bool): Use worker processes instead of threads.
 
     Returns:
-    QgsVectorLayer: The 3D empty layer.
+    Iterator[Tuple[Any, Any]]: Each key with its result, in the order of the items.
 
     """
-    # Create a memory vector layer to store the 3D polyline
-    layer_3d = QgsVectorLayer(f"LineStringZ?crs=EPSG:{EPSG_3D_CODE}", layer.name(), "memory")
-    provider = layer_3d.dataProvider()
-    provider.addAttributes([QgsField(field.name(), field.type()) for field in layer.fields()])
-    layer_3d.updateFields()
-    return layer_3d
+    if workers <= 1:
+        for key, arguments in items:
+            yield key, function(*arguments)
+        return
+
+    # The interpreter spawned processes start with, when it had to be replaced
+    previous_executable = None
+    if processes:
+        # Spawned processes do not inherit the threads of QGIS, unlike forked ones
+        context = multiprocessing.get_context('spawn')
+        if not _is_python_interpreter(sys.executable):
+            # It is set for the whole process, other plugins included, until the pool is shut down
+            previous_executable = multiprocessing.spawn.get_executable()
+            context.set_executable(_python_executable())
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    try:
+        with executor:
+            pending = deque()
+            try:
+                for key, arguments in items:
+                    pending.append((key, executor.submit(function, *arguments)))
+                    if len(pending) >= 2 * workers:
+                        key_, future = pending.popleft()
+                        yield key_, future.result()
+                while pending:
+                    key_, future = pending.popleft()
+                    yield key_, future.result()
+            finally:
+                for _, future in pending:
+                    future.cancel()
+    finally:
+        if previous_executable is not None:
+            multiprocessing.spawn.set_executable(previous_executable)
+
+def geometry_endpoints(geometries: List[QgsGeometry]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Extract the first and last vertex of each line geometry.
+
+    Parameters:
+    geometries (List[QgsGeometry]): The input line geometries.
+
+    Returns:
+    Tuple[numpy.ndarray, numpy.ndarray]: The (N, 2) start and end coordinates.
+
+    """
+    starts = np.empty((len(geometries), 2))
+    ends = np.empty((len(geometries), 2))
+    for index, geometry_ in enumerate(geometries):
+        start_point = geometry_.vertexAt(0)
+        end_point = geometry_.vertexAt(geometry_.constGet().nCoordinates() - 1)
+        starts[index] = start_point.x(), start_point.y()
+        ends[index] = end_point.x(), end_point.y()
+    return starts, ends
+
+def polylines_3d_from_vertices(vertices: np.ndarray, offsets: np.ndarray) -> List[QgsGeometry]:
+    """
+    Create 3D polyline geometries from the vertex buffer of a batch of arcs.
+
+    Parameters:
+    vertices (numpy.ndarray): The (M, 3) X, Y, Z coordinates of all the arcs.
+    offsets (numpy.ndarray): The N + 1 offsets of the arcs into the vertices.
+
+    Returns:
+    List[QgsGeometry]: The 3D polylines.
 
-def generate_3d_polyline_from_geometry(geometry_: QgsGeometry, segments: int, y_angle: float, z_scale: float) -> QgsGeometry:
+    """
+    polylines_3d = []
+    for wkb in linestring_z_wkb(vertices, offsets):
+        polyline_3d = QgsGeometry()
+        polyline_3d.fromWkb(wkb)
+        polylines_3d.append(polyline_3d)
+    return polylines_3d
+
+def generate_3d_polylines(starts: np.ndarray, ends: np.ndarray, segments, y_angle, z_scale, legacy: bool = False, transform: Optional[QgsCoordinateTransform] = None, geographic: bool = False, max_error: float = 0.0, profile: str = 'circle') -> List[QgsGeometry]:
+    """
+    Generate 3D polylines representing arcs for a batch of start and end points.
+
+    Parameters:
+    starts (numpy.ndarray): The (N, 2) start coordinates of the lines.
+    ends (numpy.ndarray): The (N, 2) end coordinates of the lines.
+    segments (int or Sequence[int]): The number of segments, scalar or one per line.
+    y_angle (float or Sequence[float]): The angle of rotation around the y-axis in degrees, scalar or one per line.
+    z_scale (float or Sequence[float]): The scaling factor along the z-axis, scalar or one per line.
+    legacy (bool): Build the arcs exactly as earlier versions of the plugin did.
+    transform (QgsCoordinateTransform): The transform applied to all the arc vertices at once, None to keep them as they are.
+    geographic (bool): The points are longitudes and latitudes, see generate_3d_arcs_geographic.
+    max_error (float): Above 0, choose the segments of each arc from its chord
+        length instead, so it stays within this distance of the true curve.
+    profile (str): The shape of the arcs, one of ARC_PROFILES, see arc_template.
+
+    Returns:
+    List[QgsGeometry]: The 3D polylines, in the order of the input points.
+
+    """
+    if max_error > 0:
+        segments = adaptive_segments(chord_lengths(starts, ends, geographic), z_scale, max_error, profile=profile)
+    if geographic:
+        vertices, offsets = generate_3d_arcs_geographic(starts, ends, segments, y_angle, z_scale, legacy, profile=profile)
+    else:
+        vertices, offsets = generate_3d_arcs(starts, ends, segments, y_angle, z_scale, legacy, profile=profile)
+    if transform is not None:
+        vertices = transform_coordinates(vertices, transform)
+    return polylines_3d_from_vertices(vertices, offsets)
+
+def _release_shared_memory(*blocks: shared_memory.SharedMemory) -> None:
+    """
+    Close and unlink shared memory blocks created by this process.
+
+    Parameters:
+    blocks (multiprocessing.shared_memory.SharedMemory): The blocks to release.
+
+    """
+    for block in blocks:
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+def chunk_parameters(parameters: Callable, features: List[QgsFeature], starts: np.ndarray, ends: np.ndarray, geographic: bool = False, max_error: float = 0.0, lengths: Optional[Callable] = None, profile: str = 'circle', mercator: bool = False) -> tuple:
+    """
+    Get the segments, y_angle and z_scale of the arcs of a chunk of features.
+
+    Parameters:
+    parameters (Callable): Returns the segments, y_angle and z_scale of a chunk of features, scalars or one per feature.
+    features (List[QgsFeature]): The features of the chunk.
+    starts (numpy.ndarray): The (N, 2) start coordinates of the features.
+    ends (numpy.ndarray): The (N, 2) end coordinates of the features.
+    geographic (bool): The points are longitudes and latitudes, see generate_3d_arcs_geographic.
+    max_error (float): Above 0, the segments are chosen per arc so it stays within
+        this distance of the true curve, see adaptive_segments, instead of being
+        taken from the parameters.
+    lengths (Callable): Returns the length of each feature of a chunk for the
+        adaptive segments, None or missing values for the chord length.
+    profile (str): The shape of the arcs, the adaptive segments depend on it.
+    mercator (bool): The arcs are built in EPSG:3857, the lengths are on the
+        ground in meters and stretched to it, see mercator_lengths. Otherwise
+        they are in the units the arcs are built in, meters for geographic ones.
+
+    Returns:
+    tuple: The segments, y_angle and z_scale, scalars or one per feature.
+
+    """
+    segments, y_angle, z_scale = parameters(features)
+    if max_error > 0:
+        chord = chord_lengths(starts, ends, geographic)
+        if lengths is not None:
+            length = np.array([np.nan if value is None else value for value in lengths(features)], dtype=float)
+            if mercator:
+                length = mercator_lengths(length, starts, ends)
+            chord = np.where(np.isfinite(length), length, chord)
+        segments = adaptive_segments(chord, z_scale, max_error, profile=profile)
+    return segments, y_angle, z_scale
+
+def feature_weights(chunks: Iterable[Tuple[List[QgsFeature], np.ndarray, np.ndarray]], geographic: bool = False, weights: Optional[Callable] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Read the weight of every feature for a vertex budget, see budget_segments.
+
+    This is a pass of its own over the features, before any arc is built,
+    only the endpoints and the weights are kept.
+
+    Parameters:
+    chunks (Iterable): The features of each chunk with their (N, 2) start and end coordinates, see feature_endpoint_chunks.
+    geographic (bool): The points are longitudes and latitudes, see chord_lengths.
+    weights (Callable): Returns the weight of each feature of a chunk, None
+        to weigh the features by the distance between their endpoints.
+
+    Returns:
+    Tuple[numpy.ndarray, numpy.ndarray]: The IDs of the features and their weights.
+
+    """
+    fids = []
+    feature_weights_ = []
+    for features, starts, ends in chunks:
+        fids.append(np.array([feature.id() for feature in features], dtype=np.int64))
+        if weights is None:
+            feature_weights_.append(chord_lengths(starts, ends, geographic))
+        else:
+            # Missing weights count as 0
+            feature_weights_.append(np.array([np.nan if value is None else value for value in weights(features)], dtype=float))
+    if not fids:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(fids), np.concatenate(feature_weights_)
+
+def budget_parameters(parameters: Callable, fids: np.ndarray, segments: np.ndarray) -> Callable:
+    """
+    Replace the segments of the arc parameters with those chosen for each feature ID.
+
+    Parameters:
+    parameters (Callable): Returns the segments, y_angle and z_scale of a chunk of features.
+    fids (numpy.ndarray): The IDs of the features, see feature_weights.
+    segments (numpy.ndarray): The number of segments of each feature, see budget_segments.
+
+    Returns:
+    Callable: Returns the segments, y_angle and z_scale of a chunk of features.
+
+    """
+    order = np.argsort(fids)
+    sorted_fids = np.asarray(fids)[order]
+    sorted_segments = np.asarray(segments)[order]
+
+    def chunk_budget_parameters(features):
+        _, y_angle, z_scale = parameters(features)
+        indexes = np.searchsorted(sorted_fids, [feature.id() for feature in features])
+        return sorted_segments[indexes], y_angle, z_scale
+
+    return chunk_budget_parameters
+
+class DedupStats:
+    """
+    Count the features of a run and the distinct arcs built for them.
+
+    Hand one to generate_3d_polyline_chunks, or to its wrappers, per run.
+
+    """
+
+    def __init__(self):
+        self.features = 0
+        self.arcs = 0
+
+    def report(self) -> str:
+        """
+        Describe how many arcs were shared between features.
+
+        Returns:
+        str: The number of features and distinct arcs and the dedup ratio.
+
+        """
+        ratio = self.features / self.arcs if self.arcs else 1.0
+        return f"Arc deduplication: {self.features} features, {self.arcs} distinct arcs ({ratio:.2f} features per arc)"
+
+def generate_3d_polyline_chunks(chunks: Iterable[Tuple[List[QgsFeature], np.ndarray, np.ndarray]], parameters: Callable, legacy: bool = False, transform: Optional[QgsCoordinateTransform] = None, geographic: bool = False, threads: int = 1, processes: int = 1, max_error: float = 0.0, lengths: Optional[Callable] = None, great_circle: bool = False, profile: str = 'circle', stats: Optional[DedupStats] = None, mercator: bool = False) -> Iterator[Tuple[List[QgsFeature], np.ndarray, List[QgsGeometry]]]:
+    """
+    Generate the 3D polylines of chunks of features, optionally in parallel.
+
+    Features of a chunk with the same endpoints and parameters share one arc,
+    see DedupStats. With threads each chunk is built, transformed and turned into geometries
+    on a worker thread. With processes the endpoints and parameters of each
+    chunk are placed in shared memory and the workers write the arcs in place
+    into a second block, sized in advance from the segments. The transform
+    and the geometries are then done in the calling process, straight from
+    that block, and it also reads and writes all the features.
+
+    Parameters:
+    chunks (Iterable): The features of each chunk with their (N, 2) start and end coordinates, see feature_endpoint_chunks.
+    parameters (Callable): Returns the segments, y_angle and z_scale of a chunk of features, scalars or one per feature.
+    legacy (bool): Build the arcs exactly as earlier versions of the plugin did.
+    transform (QgsCoordinateTransform): The transform applied to the arc vertices, None to keep them as they are.
+    geographic (bool): The points are longitudes and latitudes, see generate_3d_arcs_geographic.
+    threads (int): The number of worker threads.
+    processes (int): The number of worker processes, used instead of the threads when above 1.
+    max_error (float): Above 0, choose the segments of each arc from its length, see chunk_parameters.
+    lengths (Callable): Returns the length of each feature of a chunk, see chunk_parameters.
+    great_circle (bool): The points are longitudes and latitudes, see generate_3d_arcs_great_circle.
+    profile (str): The shape of the arcs, one of ARC_PROFILES, see arc_template.
+    stats (DedupStats): Counts the features and the distinct arcs built for them.
+    mercator (bool): The arcs are built in EPSG:3857 and the lengths are on the ground, see chunk_parameters.
+
+    Returns:
+    Iterator[Tuple[List[QgsFeature], numpy.ndarray, List[QgsGeometry]]]: The
+    features of each chunk, the (M, 3) vertices of their distinct arcs and
+    the 3D polyline of each feature.
+
+    """
+    def polylines(vertices, offsets):
+        if transform is not None:
+            vertices = transform_coordinates(vertices, transform)
+        return vertices, polylines_3d_from_vertices(vertices, offsets)
+
+    def distinct_arcs():
+        # Each distinct arc of a chunk is built, transformed and turned into a
+        # geometry once, then shared by all the features it belongs to
+        for features, starts, ends in chunks:
+            arc_parameters = chunk_parameters(parameters, features, starts, ends, geographic or great_circle, max_error, lengths, profile, mercator)
+            rows, inverse = unique_arcs(arc_rows(starts, ends, *arc_parameters))
+            if stats is not None:
+                stats.features += len(features)
+                stats.arcs += rows.shape[0]
+            yield features, inverse, rows
+
+    def shared(polylines_3d, inverse):
+        return [polylines_3d[index] for index in inverse]
+
+    if processes <= 1:
+        def arguments():
+            for features, inverse, rows in distinct_arcs():
+                yield (features, inverse), (rows[:, 0:2], rows[:, 2:4], rows[:, 4], rows[:, 5], rows[:, 6], legacy, geographic, None, great_circle, profile)
+
+        def build(*arc_arguments):
+            return polylines(*arc_vertices(*arc_arguments))
+
+        for (features, inverse), (vertices, polylines_3d) in ordered_parallel_map(build, arguments(), threads):
+            yield features, vertices, shared(polylines_3d, inverse)
+        return
+
+    # Blocks created for chunks that are not consumed yet
+    live_blocks = []
+
+    def shared_arguments():
+        for features, inverse, rows in distinct_arcs():
+            count = rows.shape[0]
+            offsets = arc_offsets(rows[:, 4], count)
+            inputs_block = shared_memory.SharedMemory(create=True, size=max(count * 7 * 8, 1))
+            vertices_block = shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]) * 3 * 8, 1))
+            live_blocks.extend([inputs_block, vertices_block])
+            inputs = np.ndarray((count, 7), buffer=inputs_block.buf)
+            inputs[:] = rows
+            del inputs
+            yield (features, inverse, offsets, inputs_block, vertices_block), (inputs_block.name, vertices_block.name, count, int(offsets[-1]), legacy, geographic, great_circle, profile)
+
+    try:
+        for (features, inverse, offsets, inputs_block, vertices_block), _ in ordered_parallel_map(arc_vertices_shared, shared_arguments(), processes, processes=True):
+            shared_vertices = np.ndarray((offsets[-1], 3), buffer=vertices_block.buf)
+            vertices, polylines_3d = polylines(shared_vertices, offsets)
+            # Hand out a copy, the block is released before the next chunk
+            vertices = np.array(vertices)
+            del shared_vertices
+            live_blocks.remove(inputs_block)
+            live_blocks.remove(vertices_block)
+            _release_shared_memory(inputs_block, vertices_block)
+            yield features, vertices, shared(polylines_3d, inverse)
+    finally:
+        _release_shared_memory(*live_blocks)
+
+class _LodFeatures(list):
+    """
+    The features of a chunk, for one level of detail.
+
+    """
+    segments = 0
+
+def lod_3d_polyline_chunks(chunks: Iterable[Tuple[List[QgsFeature], np.ndarray, np.ndarray]], parameters: Callable, lod_segments: List[int], **kwargs) -> Iterator[Tuple[List[QgsFeature], int, np.ndarray, List[QgsGeometry]]]:
+    """
+    Generate the 3D polylines of chunks of features at several levels of detail.
+
+    The endpoints of each chunk are read and transformed once, then the arcs
+    of each level are built from them with its number of segments.
+
+    Parameters:
+    chunks (Iterable): The features of each chunk with their (N, 2) start and end coordinates, see feature_endpoint_chunks.
+    parameters (Callable): Returns the segments, y_angle and z_scale of a chunk of features, the segments are replaced by those of each level.
+    lod_segments (List[int]): The numbers of segments of the levels.
+    kwargs: The other keyword arguments of generate_3d_polyline_chunks, such as threads.
+
+    Returns:
+    Iterator[Tuple[List[QgsFeature], int, numpy.ndarray, List[QgsGeometry]]]: The
+    features of each chunk, the number of segments of the level, the (M, 3)
+    vertices of their distinct arcs and the 3D polyline of each feature.
+
+    """
+    def level_chunks():
+        for features, starts, ends in chunks:
+            for segments in lod_segments:
+                level_features = _LodFeatures(features)
+                level_features.segments = segments
+                yield level_features, starts, ends
+
+    def level_parameters(features):
+        _, y_angle, z_scale = parameters(features)
+        return features.segments, y_angle, z_scale
+
+    # The levels set the segments, they are never chosen from the lengths
+    kwargs.pop('max_error', None)
+    for features, vertices, polylines_3d in generate_3d_polyline_chunks(level_chunks(), level_parameters, **kwargs):
+        yield features, features.segments, vertices, polylines_3d
+
+class _CachedFeatures(list):
+    """
+    The features of a chunk whose arcs are not in the cache, with their arc parameters.
+
+    """
+    parameters = ()
+
+def cached_3d_polyline_chunks(chunks: Iterable[Tuple[List[QgsFeature], np.ndarray, np.ndarray]], parameters: Callable, cache: ArcCache, geographic: bool = False, max_error: float = 0.0, lengths: Optional[Callable] = None, great_circle: bool = False, profile: str = 'circle', mercator: bool = False, **kwargs) -> Iterator[Tuple[List[QgsFeature], np.ndarray, List[QgsGeometry]]]:
+    """
+    Generate the 3D polylines of chunks of features, reusing the arcs of earlier runs.
+
+    Features whose ID, endpoints and parameters match an arc in the cache get
+    that arc back, only the others go through generate_3d_polyline_chunks and
+    are then stored in the cache. The parameters of each chunk are worked out
+    once, see chunk_parameters, so the arcs are rebuilt from the very
+    parameters they are stored under. Each chunk comes out whole, with the
+    reused and rebuilt arcs of its features in their input order.
+
+    Parameters:
+    chunks (Iterable): The features of each chunk with their (N, 2) start and end coordinates, see feature_endpoint_chunks.
+    parameters (Callable): Returns the segments, y_angle and z_scale of a chunk of features, scalars or one per feature.
+    cache (ArcCache): The arcs of earlier runs, opened with the settings of this one.
+    geographic (bool): The points are longitudes and latitudes, see generate_3d_arcs_geographic.
+    max_error (float): Above 0, choose the segments of each arc from its length, see chunk_parameters.
+    lengths (Callable): Returns the length of each feature of a chunk, see chunk_parameters.
+    great_circle (bool): The points are longitudes and latitudes, see generate_3d_arcs_great_circle.
+    profile (str): The shape of the arcs, one of ARC_PROFILES, see arc_template.
+    mercator (bool): The arcs are built in EPSG:3857 and the lengths are on the ground, see chunk_parameters.
+    kwargs: The other keyword arguments of generate_3d_polyline_chunks, such as threads.
+
+    Returns:
+    Iterator[Tuple[List[QgsFeature], numpy.ndarray, List[QgsGeometry]]]: The
+    features of each chunk, the (M, 3) vertices of their arcs and the 3D polylines.
+
+    """
+    # The chunks read so far, with the arcs found in the cache and the hashes of all their arcs
+    pending = deque()
+
+    def rebuilt_chunks():
+        for features, starts, ends in chunks:
+            fids = [feature.id() for feature in features]
+            arc_parameters = chunk_parameters(parameters, features, starts, ends, geographic or great_circle, max_error, lengths, profile, mercator)
+            keys = cache.keys(starts, ends, *arc_parameters)
+            wkbs = cache.lookup(fids, keys)
+            pending.append((features, keys, wkbs))
+            rows = [row for row, wkb in enumerate(wkbs) if wkb is None]
+            # Chunks without any arc to build still go through, so every
+            # chunk read gets its rebuilt arcs back in order
+            rebuilt_features = _CachedFeatures(features[row] for row in rows)
+            rebuilt_features.parameters = tuple(value[rows] if np.ndim(value) else value for value in map(np.asarray, arc_parameters))
+            yield rebuilt_features, starts[rows], ends[rows]
+
+    def rebuilt_parameters(features):
+        return features.parameters
+
+    # The segments are already chosen, they are not worked out again from the lengths
+    arc_chunks = generate_3d_polyline_chunks(rebuilt_chunks(), rebuilt_parameters, geographic=geographic, great_circle=great_circle, profile=profile, **kwargs)
+    for rebuilt_features, rebuilt_vertices, rebuilt_polylines in arc_chunks:
+        features, keys, wkbs = pending.popleft()
+        if rebuilt_features:
+            cache.store(
+                [feature.id() for feature in rebuilt_features],
+                [key for key, wkb in zip(keys, wkbs) if wkb is None],
+                [bytes(polyline_3d.asWkb()) for polyline_3d in rebuilt_polylines],
+            )
+        # Merge the reused arcs back between the rebuilt ones
+        rebuilt = iter(rebuilt_polylines)
+        polylines_3d = []
+        for wkb in wkbs:
+            if wkb is None:
+                polylines_3d.append(next(rebuilt))
+            else:
+                polyline_3d = QgsGeometry()
+                polyline_3d.fromWkb(wkb)
+                polylines_3d.append(polyline_3d)
+        reused_vertices, _ = linestring_z_vertices([wkb for wkb in wkbs if wkb is not None])
+        yield features, np.concatenate([rebuilt_vertices, reused_vertices]), polylines_3d
+
+def generate_3d_polylines_from_geometries(geometries: List[QgsGeometry], segments, y_angle, z_scale, legacy: bool = False, max_error: float = 0.0, profile: str = 'circle') -> List[QgsGeometry]:
+    """
+    Generate 3D polylines representing arcs for a batch of line geometries.
+
+    Parameters:
+    geometries (List[QgsGeometry]): The input line geometries.
+    segments (int or Sequence[int]): The number of segments, scalar or one per geometry.
+    y_angle (float or Sequence[float]): The angle of rotation around the y-axis in degrees, scalar or one per geometry.
+    z_scale (float or Sequence[float]): The scaling factor along the z-axis, scalar or one per geometry.
+    legacy (bool): Build the arcs exactly as earlier versions of the plugin did.
+    max_error (float): Above 0, choose the segments of each arc from its chord
+        length instead, so it stays within this distance of the true curve.
+    profile (str): The shape of the arcs, one of ARC_PROFILES, see arc_template.
+
+    Returns:
+    List[QgsGeometry]: The 3D polylines, in the order of the input geometries.
+
+    """
+    starts, ends = geometry_endpoints(geometries)
+    return generate_3d_polylines(starts, ends, segments, y_angle, z_scale, legacy, max_error=max_error, profile=profile)
+
+def generate_3d_polyline_from_geometry(geometry_: QgsGeometry, segments: int, y_angle: float, z_scale: float, legacy: bool = False, max_error: float = 0.0, profile: str = 'circle') -> QgsGeometry:
     """
     Generate a 3D polyline representing an arc based on the input line geometry.
 
@@ -124,59 +763,16 @@ def generate_3d_polyline_from_geometry(geometry_: QgsGeometry, segments: int, y_
     segments (int): The number of segments to divide the arc into.
     y_angle (float): The angle of rotation around the y-axis in degrees.
     z_scale (float): The scaling factor along the z-axis.
+    legacy (bool): Build the arc exactly as earlier versions of the plugin did.
+    max_error (float): Above 0, choose the number of segments from the chord
+        length instead, so the arc stays within this distance of the true curve.
+    profile (str): The shape of the arc, one of ARC_PROFILES, see arc_template.
 
     Returns:
     QgsGeometry: The 3D polyline representing the arc.
 
     """
-    # Define the start and end points of the line
-    start_point = QgsPoint(geometry_.asPolyline()[0])
-    end_point = QgsPoint(geometry_.asPolyline()[-1])
-
-    # Get the center point of the arc
-    center_point = QgsGeometry.fromPointXY(geometry_.centroid().asPoint())
-
-    # Create a circle polygon with the specified radius
-    radius = int(start_point.distance(end_point) / 2)
-    circle = QgsGeometry.fromPointXY(QgsPointXY(0, 0)).buffer(radius, segments)
-
-    # Create an empty array to store the X, Y, Z coordinates
-    points_array = np.array([[point.x(), point.y(), 0.0] for point in circle.asPolygon()[0]])
-
-    # Calculate the bearing between the start and end points
-    bearing = end_point.azimuth(start_point)
-
-    # Apply transformations to the points
-    points_array = np.hstack([points_array, np.ones((points_array.shape[0], 1))])
-    transformed_points = np.dot(points_array, rotation_y(np.radians(90)))
-    transformed_points = transformed_points[transformed_points[:, 2] >= -0.1]
-    unique_data = np.unique(transformed_points, axis=0)
-    sorted_points = unique_data[unique_data[:, 1].argsort()]
-    transformed_points = np.dot(sorted_points, rotation_y(np.radians(y_angle - 90)))
-    transformed_points = np.dot(transformed_points, rotation_z(np.radians(bearing)))
-    transformed_points = np.dot(transformed_points, scale_z(z_scale))
-    transformed_points = transformed_points.dot(translate(center_point.asPoint().x(), center_point.asPoint().y()).T)
-    transformed_points = transformed_points.dot(translate(center_point.asPoint().x(), center_point.asPoint().y()).T)
-    # Slightly align the points so they would be placed on original lines
-    dx = transformed_points[0][0].astype(float) - end_point.x()
-    dy = transformed_points[0][1].astype(float) - end_point.y()
-    if np.linalg.norm([dx, dy]) > 0.5:
-        transformed_points = transformed_points.dot(translate(-dx, -dy).T)
-
-
-
-    # Create a list of QgsPoint objects from the transformed points
-    QgsPoint_list = []
-    for i in range(transformed_points.shape[0]):
-        x = transformed_points[i][0]
-        y = transformed_points[i][1]
-        z = transformed_points[i][2]
-        QgsPoint_list.append(QgsPoint(x, y, z))
-    
-    # Create a QgsGeometry for the 3D polyline
-    polyline3D = QgsGeometry.fromPolyline(QgsPoint_list)
-    
-    return polyline3D
+    return generate_3d_polylines_from_geometries([geometry_], segments, y_angle, z_scale, legacy, max_error, profile)[0]
 
 def append_geometry_data_to_3d_arc(layer_3d: QgsVectorLayer, polyline3D: QgsGeometry, feature: QgsFeature) -> QgsVectorLayer:
     """
@@ -214,6 +810,375 @@ def append_geometry_data_to_3d_arc(layer_3d: QgsVectorLayer, polyline3D: QgsGeom
     # Return the updated layer
     return layer_3d
 
+def new_3d_arc_features(layer_3d: QgsVectorLayer, polylines_3d: List[QgsGeometry], features: List[QgsFeature]) -> List[QgsFeature]:
+    """
+    Create the features of a 3D arc layer for a batch of input features.
+
+    Parameters:
+    layer_3d (QgsVectorLayer): The 3D arc layer.
+    polylines_3d (List[QgsGeometry]): The 3D polylines representing the arcs.
+    features (List[QgsFeature]): The input features, in the order of the polylines.
+
+    Returns:
+    List[QgsFeature]: The new features, not yet added to the layer.
+
+    """
+    if not features:
+        return []
+    # Look up the attribute indexes once for the whole batch
+    field_indexes = [features[0].fields().lookupField(field_name) for field_name in layer_3d.fields().names()]
+    new_features = []
+    for feature, polyline_3d in zip(features, polylines_3d):
+        attributes_ = feature.attributes()
+        new_feature = QgsFeature(layer_3d.fields())
+        new_feature.setGeometry(polyline_3d)
+        new_feature.setAttributes([attributes_[index] for index in field_indexes])
+        new_features.append(new_feature)
+    return new_features
+
+def lod_fields(fields: QgsFields) -> QgsFields:
+    """
+    Add the level of detail field to the fields of a 3D arc layer.
+
+    Parameters:
+    fields (QgsFields): The fields copied from the input layer.
+
+    Returns:
+    QgsFields: A copy of the fields followed by LOD_FIELD.
+
+    """
+    fields = QgsFields(fields)
+    fields.append(QgsField(LOD_FIELD, QVariant.Int))
+    return fields
+
+def lod_arc_features(fields: QgsFields, polylines_3d: List[QgsGeometry], features: List[QgsFeature], segments: int) -> List[QgsFeature]:
+    """
+    Create the features of one level of detail of a 3D arc layer.
+
+    Parameters:
+    fields (QgsFields): The fields of the 3D arc layer, see lod_fields.
+    polylines_3d (List[QgsGeometry]): The 3D polylines representing the arcs.
+    features (List[QgsFeature]): The input features, in the order of the polylines.
+    segments (int): The number of segments of the level, written to LOD_FIELD.
+
+    Returns:
+    List[QgsFeature]: The new features.
+
+    """
+    if not features:
+        return []
+    # Look up the attribute indexes once for the whole batch
+    field_indexes = [features[0].fields().lookupField(field_name) for field_name in fields.names()[:-1]]
+    new_features = []
+    for feature, polyline_3d in zip(features, polylines_3d):
+        attributes_ = feature.attributes()
+        new_feature = QgsFeature(fields)
+        new_feature.setGeometry(polyline_3d)
+        new_feature.setAttributes([attributes_[index] for index in field_indexes] + [segments])
+        new_features.append(new_feature)
+    return new_features
+
+def parse_lod_segments(text: str) -> List[int]:
+    """
+    Read the numbers of segments of the levels of detail, e.g. "4, 8, 16".
+
+    Parameters:
+    text (str): The comma separated numbers of segments, empty for a single level.
+
+    Returns:
+    List[int]: The distinct numbers of segments, from the coarsest to the finest.
+
+    """
+    segments = sorted({int(value) for value in text.replace(';', ',').split(',') if value.strip()})
+    if segments and segments[0] < 1:
+        raise ValueError(f"The levels of detail need at least 1 segment, got {segments[0]}")
+    return segments
+
+def lod_renderer(layer: QgsVectorLayer, lod_segments: List[int], scale: float = LOD_SCALE) -> QgsRuleBasedRenderer:
+    """
+    Create a renderer drawing a single level of detail of the arcs at each scale.
+
+    The coarsest level is drawn when zoomed out beyond the scale, each finer
+    one down to a scale ten times larger, and the finest one below that. The
+    rules filter on LOD_FIELD, so data providers only load the level drawn.
+
+    Parameters:
+    layer (QgsVectorLayer): The 3D arc layer, see lod_fields.
+    lod_segments (List[int]): The numbers of segments of the levels, from the coarsest to the finest.
+    scale (float): The scale denominator below which the coarsest level is no longer drawn.
+
+    Returns:
+    QgsRuleBasedRenderer: The renderer.
+
+    """
+    symbol = QgsSymbol.defaultSymbol(layer.geometryType())
+    root_rule = QgsRuleBasedRenderer.Rule(None)
+    for level, segments in enumerate(lod_segments):
+        # Scale denominators, the minimum scale being the most zoomed out one
+        minimum_scale = scale / 10 ** (level - 1) if level > 0 else 0
+        maximum_scale = scale / 10 ** level if level < len(lod_segments) - 1 else 0
+        rule = QgsRuleBasedRenderer.Rule(symbol.clone(), maximum_scale, minimum_scale, f'"{LOD_FIELD}" = {segments}', f"{segments} segments")
+        root_rule.appendChild(rule)
+    return QgsRuleBasedRenderer(root_rule)
+
+class LodRendererPostProcessor(QgsProcessingLayerPostProcessorInterface):
+    """
+    Set up the level of detail renderer of a processing output once it is loaded.
+
+    Parameters:
+    lod_segments (List[int]): The numbers of segments of the levels, from the coarsest to the finest.
+
+    """
+
+    # The post processor of the last run, Processing does not keep a reference to it
+    instance = None
+
+    def __init__(self, lod_segments: List[int]):
+        super().__init__()
+        self.lod_segments = lod_segments
+
+    @staticmethod
+    def create(lod_segments: List[int]) -> 'LodRendererPostProcessor':
+        """
+        Create a post processor and keep it alive until the output is loaded.
+
+        Parameters:
+        lod_segments (List[int]): The numbers of segments of the levels, from the coarsest to the finest.
+
+        Returns:
+        LodRendererPostProcessor: The post processor.
+
+        """
+        LodRendererPostProcessor.instance = LodRendererPostProcessor(lod_segments)
+        return LodRendererPostProcessor.instance
+
+    def postProcessLayer(self, layer, context, feedback):
+        if isinstance(layer, QgsVectorLayer):
+            layer.setRenderer(lod_renderer(layer, self.lod_segments))
+            layer.triggerRepaint()
+
+def write_3d_arc_features(layer_3d: QgsVectorLayer, new_features: List[QgsFeature], extent: Optional[QgsRectangle] = None) -> QgsVectorLayer:
+    """
+    Add all the features to a 3D arc layer at once.
+
+    Parameters:
+    layer_3d (QgsVectorLayer): The 3D arc layer.
+    new_features (List[QgsFeature]): The features to add.
+    extent (QgsRectangle): The known extent of the arcs, if None the layer
+        asks its provider for it once all the features are added.
+
+    Returns:
+    QgsVectorLayer: The updated 3D arc layer.
+
+    """
+    layer_3d.dataProvider().addFeatures(new_features)
+    if extent is None:
+        layer_3d.updateExtents()
+    else:
+        layer_3d.setExtent(extent)
+    return layer_3d
+
+def transform_to_3d_crs(crs: QgsCoordinateReferenceSystem) -> Optional[QgsCoordinateTransform]:
+    """
+    Get the transform from a CRS to the CRS the arcs are built in.
+
+    Parameters:
+    crs (QgsCoordinateReferenceSystem): The CRS of the input data.
+
+    Returns:
+    QgsCoordinateTransform: The transform, or None if the data is already in EPSG:3857.
+
+    """
+    if str(EPSG_3D_CODE) in crs.authid():
+        return None
+    return QgsCoordinateTransform(crs, QgsCoordinateReferenceSystem(EPSG_3D_CODE), QgsProject.instance())
+
+def transform_from_3d_crs(crs: QgsCoordinateReferenceSystem) -> Optional[QgsCoordinateTransform]:
+    """
+    Get the transform from the CRS the arcs are built in back to a CRS.
+
+    Parameters:
+    crs (QgsCoordinateReferenceSystem): The CRS of the output data.
+
+    Returns:
+    QgsCoordinateTransform: The transform, or None if the data is already in EPSG:3857.
+
+    """
+    if str(EPSG_3D_CODE) in crs.authid():
+        return None
+    return QgsCoordinateTransform(QgsCoordinateReferenceSystem(EPSG_3D_CODE), crs, QgsProject.instance())
+
+def transform_to_lon_lat(crs: QgsCoordinateReferenceSystem) -> Optional[QgsCoordinateTransform]:
+    """
+    Get the transform from a CRS to the longitudes and latitudes great circle arcs are built from.
+
+    Parameters:
+    crs (QgsCoordinateReferenceSystem): The CRS of the input data.
+
+    Returns:
+    QgsCoordinateTransform: The transform, or None if the data is already in EPSG:4326.
+
+    """
+    if crs.authid() == f"EPSG:{EPSG_LON_LAT_CODE}":
+        return None
+    return QgsCoordinateTransform(crs, QgsCoordinateReferenceSystem(f"EPSG:{EPSG_LON_LAT_CODE}"), QgsProject.instance())
+
+def transform_from_lon_lat(crs: QgsCoordinateReferenceSystem) -> Optional[QgsCoordinateTransform]:
+    """
+    Get the transform from the longitudes and latitudes of great circle arcs back to a CRS.
+
+    Parameters:
+    crs (QgsCoordinateReferenceSystem): The CRS of the output data.
+
+    Returns:
+    QgsCoordinateTransform: The transform, or None if the data is already in EPSG:4326.
+
+    """
+    if crs.authid() == f"EPSG:{EPSG_LON_LAT_CODE}":
+        return None
+    return QgsCoordinateTransform(QgsCoordinateReferenceSystem(f"EPSG:{EPSG_LON_LAT_CODE}"), crs, QgsProject.instance())
+
+def transform_coordinates(coordinates: np.ndarray, transform: QgsCoordinateTransform) -> np.ndarray:
+    """
+    Transform the X and Y of a whole array of coordinates with a single call.
+
+    The coordinates are handed to PROJ as one line string instead of one
+    geometry at a time. Any Z values are kept as they are.
+
+    Parameters:
+    coordinates (numpy.ndarray): The (N, 2) or (N, 3) coordinates.
+    transform (QgsCoordinateTransform): The transform to apply.
+
+    Returns:
+    numpy.ndarray: The transformed coordinates, with the shape of the input.
+
+    """
+    transformed = np.array(coordinates, dtype=float)
+    if not transformed.shape[0]:
+        return transformed
+    line = QgsLineString(transformed[:, 0].tolist(), transformed[:, 1].tolist())
+    line.transform(transform)
+    transformed[:, 0] = line.xVector()
+    transformed[:, 1] = line.yVector()
+    return transformed
+
+def transform_unique_coordinates(coordinates: np.ndarray, transform: QgsCoordinateTransform, cache: Optional[dict] = None) -> np.ndarray:
+    """
+    Transform an array of coordinates, each distinct coordinate only once.
+
+    In hub and spoke networks the same node is the endpoint of many lines,
+    so only the distinct coordinates are handed to transform_coordinates and
+    the results are scattered back. With a cache, coordinates transformed
+    by earlier calls are not transformed again either.
+
+    Parameters:
+    coordinates (numpy.ndarray): The (N, 2) coordinates.
+    transform (QgsCoordinateTransform): The transform to apply.
+    cache (dict): The transformed coordinates by the bytes of the input ones,
+        shared between calls with the same transform and updated in place.
+
+    Returns:
+    numpy.ndarray: The (N, 2) transformed coordinates.
+
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    if coordinates.shape[0] < 2:
+        return transform_coordinates(coordinates, transform)
+    distinct, inverse = np.unique(coordinates, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    if cache is None:
+        return transform_coordinates(distinct, transform)[inverse]
+
+    keys = [coordinate.tobytes() for coordinate in distinct]
+    # The result is gathered before the cache is updated, it may be cleared then
+    transformed = np.empty(distinct.shape)
+    missing = []
+    for index, key in enumerate(keys):
+        cached = cache.get(key)
+        if cached is None:
+            missing.append(index)
+        else:
+            transformed[index] = cached
+    if missing:
+        transformed[missing] = transform_coordinates(distinct[missing], transform)
+        if len(cache) + len(missing) > TRANSFORM_CACHE_SIZE:
+            cache.clear()
+        cache.update(zip([keys[index] for index in missing], transformed[missing]))
+    return transformed[inverse]
+
+def feature_endpoint_chunks(features: Iterable[QgsFeature], size: int, transform: Optional[QgsCoordinateTransform] = None) -> Iterator[Tuple[List[QgsFeature], np.ndarray, np.ndarray]]:
+    """
+    Lazily read features in chunks together with their start and end points.
+
+    Only the two endpoints of each feature are transformed, all the ones of
+    a chunk in a single call, and nothing is copied into an intermediate layer.
+    Nodes shared by many lines, and by many chunks, are transformed only once.
+
+    Parameters:
+    features (Iterable[QgsFeature]): The input features, e.g. layer.getFeatures().
+    size (int): The maximum number of features per chunk.
+    transform (QgsCoordinateTransform): The transform to apply to the endpoints, None to keep them as they are.
+
+    Returns:
+    Iterator[Tuple[List[QgsFeature], numpy.ndarray, numpy.ndarray]]: The features
+    of each chunk with their (N, 2) start and end coordinates.
+
+    """
+    # The transformed nodes, by the bytes of their input coordinates
+    cache = {}
+    for chunk in chunked(features, size):
+        starts, ends = geometry_endpoints([feature.geometry() for feature in chunk])
+        if transform is not None:
+            endpoints = transform_unique_coordinates(np.concatenate([starts, ends]), transform, cache)
+            starts, ends = endpoints[:len(chunk)], endpoints[len(chunk):]
+        yield chunk, starts, ends
+
+def benchmark_transforms(layer: QgsVectorLayer, segments: int = 10, y_angle: float = 90, z_scale: float = 0.5, limit: int = 10000) -> dict:
+    """
+    Time the EPSG:3857 round trip per geometry against the batched transforms.
+
+    Run it from the QGIS Python console on a layer that is not in EPSG:3857.
+
+    Parameters:
+    layer (QgsVectorLayer): The input line layer.
+    segments (int): The number of segments to divide the arcs into.
+    y_angle (float): The angle of rotation around the y-axis.
+    z_scale (float): The scaling factor along the z-axis.
+    limit (int): The maximum number of features to time.
+
+    Returns:
+    dict: The number of features, the seconds spent by each path and the speedup.
+
+    """
+    features = list(islice(layer.getFeatures(), limit))
+    transform_to = QgsCoordinateTransform(layer.crs(), QgsCoordinateReferenceSystem(EPSG_3D_CODE), QgsProject.instance())
+    transform_from = QgsCoordinateTransform(QgsCoordinateReferenceSystem(EPSG_3D_CODE), layer.crs(), QgsProject.instance())
+    starts, ends = geometry_endpoints([feature.geometry() for feature in features])
+    vertices, offsets = generate_3d_arcs(starts, ends, segments, y_angle, z_scale)
+    polylines_3d = polylines_3d_from_vertices(vertices, offsets)
+
+    # Every input geometry and every arc transformed on its own
+    start_time = time.perf_counter()
+    for feature, polyline_3d in zip(features, polylines_3d):
+        geometry_ = feature.geometry()
+        geometry_.transform(transform_to)
+        polyline_3d.transform(transform_from)
+    per_geometry = time.perf_counter() - start_time
+
+    # The endpoints and the arc vertices transformed as two arrays
+    start_time = time.perf_counter()
+    starts, ends = geometry_endpoints([feature.geometry() for feature in features])
+    transform_coordinates(np.concatenate([starts, ends]), transform_to)
+    transform_coordinates(vertices, transform_from)
+    batched = time.perf_counter() - start_time
+
+    return {
+        'features': len(features),
+        'per_geometry': per_geometry,
+        'batched': batched,
+        'speedup': per_geometry / batched if batched else float('inf'),
+    }
+
 def reproject_layer(layer):
     """
     Reproject a layer to the target CRS.
@@ -231,7 +1196,7 @@ def reproject_layer(layer):
         target_crs = QgsCoordinateReferenceSystem(EPSG_3D_CODE)
 
         # Create a new layer for the reprojected data
-        reprojected_layer = QgsVectorLayer("Point?crs=EPSG:3857", layer.name(), "memory")
+        reprojected_layer = QgsVectorLayer(f"{QgsWkbTypes.displayString(layer.wkbType())}?crs=EPSG:{EPSG_3D_CODE}", layer.name(), "memory")
 
         # Get the transform object
         transform = QgsCoordinateTransform(layer.crs(), target_crs, QgsProject.instance())
@@ -257,7 +1222,7 @@ def reproject_layer(layer):
     else:
         return layer
 
-def main(layer: QgsVectorLayer, segments: int, y_angle: float, z_scale: float) -> QgsVectorLayer:
+def main(layer: QgsVectorLayer, segments: int, y_angle: float, z_scale: float, legacy: bool = False, extent_from_arrays: bool = False, native_crs: bool = False, threads: int = 1, processes: int = 1, field_names: Optional[List[str]] = None, cache_path: Optional[str] = None, max_error: float = 0.0, lod_segments: Optional[List[int]] = None, great_circle: bool = False, profile: str = 'circle', vertex_budget: int = 0, weight_field: Optional[str] = None, source=None, feedback=None) -> QgsVectorLayer:
     """
     Generate a 3D arc layer based on the input layer.
 
@@ -266,27 +1231,276 @@ def main(layer: QgsVectorLayer, segments: int, y_angle: float, z_scale: float) -
     segments (int): The number of segments to divide the arc into.
     y_angle (float): The angle of rotation around the y-axis.
     z_scale (float): The scaling factor along the z-axis.
+    legacy (bool): Build the arcs exactly as earlier versions of the plugin did.
+    extent_from_arrays (bool): Compute the layer extent from the arc vertices
+        instead of asking the data provider for it.
+    native_crs (bool): Build the arcs in the CRS of the input layer instead of EPSG:3857.
+    threads (int): The number of threads building the arcs.
+    processes (int): The number of processes building the arcs, used instead of the threads when above 1.
+    field_names (List[str]): The names of the fields copied to the arcs, all of
+        them if empty or None. The other fields are not read at all.
+    cache_path (str): A SQLite file keeping the arcs between runs, so only new
+        or changed features are rebuilt, see ArcCache. None to build them all.
+    max_error (float): Above 0, choose the segments of each arc from its chord
+        length instead, so it stays within this distance of the true curve.
+    lod_segments (List[int]): Write the arcs with each of these numbers of
+        segments instead, with their number in LOD_FIELD and a renderer
+        drawing one level per scale range, see lod_renderer. The cache is not
+        used then.
+    great_circle (bool): Build the arcs along great circles with their heights
+        in meters, see generate_3d_arcs_great_circle. The layer is in the CRS
+        of the input layer then, native_crs is not used.
+    profile (str): The shape of the arcs, one of ARC_PROFILES: a circle, or
+        a parabola as high as the circle, see arc_template.
+    vertex_budget (int): Above 0, the total number of vertices of the arcs,
+        shared between the features in proportion to their length or weight
+        in a first pass over the layer, see budget_segments. It replaces the
+        segments and the maximum error, and is not used with levels of detail.
+    weight_field (str): The field holding the weights of the features for the
+        vertex budget, None to weigh them by the distance between their endpoints.
+    source (QgsAbstractFeatureSource): Read the features from this source
+        instead of the layer, e.g. a QgsVectorLayerFeatureSource when running
+        outside of the main thread.
+    feedback (QgsFeedback or QgsTask): Receives the progress and is checked for cancellation.
 
     Returns:
     QgsVectorLayer: The 3D arc layer.
 
     """
     # Create an empty 3D layer based on the input layer
-    layer_3d = create_3d_empty_layer_from_layer(layer)
-
-    # Reproject the input layer to EPSG:3857
-    layer_rep = reproject_layer(layer)
-    # Iterate over each feature in the input layer
-    for feature in layer_rep.getFeatures():
-        # Generate a list of 3D points representing the arc for the current feature
-        polyline_3d = generate_3d_polyline_from_geometry(feature.geometry(), segments, y_angle, z_scale)
-        
-        # Append the geometry data to the 3D arc layer
-        layer_3d = append_geometry_data_to_3d_arc(layer_3d, polyline_3d, feature)
-    
+    layer_3d = create_3d_empty_layer_from_layer(layer, layer.crs() if native_crs or great_circle else None, field_names)
+    transform = None if native_crs else transform_to_3d_crs(layer.crs())
+    geographic = native_crs and layer.crs().isGeographic()
+    vertex_transform = None
+    if great_circle:
+        # Great circles are built from longitudes and latitudes, and brought back to the CRS of the layer
+        transform, vertex_transform = transform_to_lon_lat(layer.crs()), transform_from_lon_lat(layer.crs())
+        geographic = False
+    progress = ProgressReporter(feedback, max(layer.featureCount(), 0) * max(len(lod_segments or []), 1))
+    if lod_segments:
+        layer_3d.dataProvider().addAttributes([QgsField(LOD_FIELD, QVariant.Int)])
+        layer_3d.updateFields()
+
+    new_features = []
+    lower, upper = np.full(2, np.inf), np.full(2, -np.inf)
+    # Iterate over the features of the input layer in batches, reprojecting
+    # their endpoints to EPSG:3857 as they are read
+    request = attribute_subset_request(layer.fields(), field_names)
+    chunks = feature_endpoint_chunks((source or layer).getFeatures(request), DEFAULT_BATCH_SIZE, transform)
+    parameters = lambda features: (segments, y_angle, z_scale)
+    if vertex_budget > 0 and not lod_segments:
+        weight_request = attribute_subset_request(layer.fields(), [weight_field]) if weight_field else QgsFeatureRequest().setNoAttributes()
+        weight_chunks = feature_endpoint_chunks((source or layer).getFeatures(weight_request), DEFAULT_BATCH_SIZE, transform)
+        weights = (lambda features: [feature[weight_field] for feature in features]) if weight_field else None
+        fids, feature_weights_ = feature_weights(weight_chunks, geographic or great_circle, weights)
+        parameters = budget_parameters(parameters, fids, budget_segments(feature_weights_, vertex_budget))
+        max_error = 0.0
+    if lod_segments:
+        cache = None
+        lod_chunks = lod_3d_polyline_chunks(chunks, parameters, lod_segments, legacy=legacy, transform=vertex_transform, geographic=geographic, threads=threads, processes=processes, great_circle=great_circle, profile=profile)
+        arc_chunks = ((features, vertices, polylines_3d) for features, _, vertices, polylines_3d in lod_chunks)
+    elif cache_path:
+        # The arcs also depend on the CRS they are built in
+        cache = ArcCache(cache_path, f"legacy={legacy} native_crs={native_crs} great_circle={great_circle} profile={profile} crs={layer.crs().authid()}")
+        arc_chunks = cached_3d_polyline_chunks(chunks, parameters, cache, legacy=legacy, transform=vertex_transform, geographic=geographic, threads=threads, processes=processes, max_error=max_error, great_circle=great_circle, profile=profile)
+    else:
+        cache = None
+        arc_chunks = generate_3d_polyline_chunks(chunks, parameters, legacy=legacy, transform=vertex_transform, geographic=geographic, threads=threads, processes=processes, max_error=max_error, great_circle=great_circle, profile=profile)
+    for features, vertices, polylines_3d in arc_chunks:
+        if progress.canceled:
+            break
+        if lod_segments:
+            # The chunks come with their level of detail
+            new_features.extend(lod_arc_features(layer_3d.fields(), polylines_3d, features, features.segments))
+        else:
+            new_features.extend(new_3d_arc_features(layer_3d, polylines_3d, features))
+        if extent_from_arrays and vertices.size:
+            lower = np.minimum(lower, vertices[:, :2].min(axis=0))
+            upper = np.maximum(upper, vertices[:, :2].max(axis=0))
+        progress.update(len(features))
+    progress.finish()
+    if cache is not None:
+        cache.close()
+
+    # Append all the arcs to the 3D arc layer at once
+    extent = QgsRectangle(lower[0], lower[1], upper[0], upper[1]) if extent_from_arrays and new_features else None
+    layer_3d = write_3d_arc_features(layer_3d, new_features, extent)
+    if lod_segments:
+        layer_3d.setRenderer(lod_renderer(layer_3d, lod_segments))
+
     # Return the updated 3D arc layer
     return layer_3d
 
+def main_task(layer: QgsVectorLayer, segments: int, y_angle: float, z_scale: float, **kwargs) -> QgsTask:
+    """
+    Create a background task running main(), so the QGIS interface stays responsive.
+
+    The 3D arc layer is added to the current project once the task is done,
+    unless it was cancelled.
+    Start it with QgsApplication.taskManager().addTask(task).
+
+    Parameters:
+    layer (QgsVectorLayer): The input layer.
+    segments (int): The number of segments to divide the arc into.
+    y_angle (float): The angle of rotation around the y-axis.
+    z_scale (float): The scaling factor along the z-axis.
+    kwargs: The other keyword arguments of main(), such as threads.
+
+    Returns:
+    QgsTask: The task, not yet started.
+
+    """
+    # The features have to be read through a source created in the main thread
+    source = QgsVectorLayerFeatureSource(layer)
+
+    def run(task):
+        layer_3d = main(layer, segments, y_angle, z_scale, source=source, feedback=task, **kwargs)
+        # A cancelled run stops part way, its layer is dropped
+        if task.isCanceled():
+            return None
+        # Hand the new layer over to the main thread, where the project lives
+        layer_3d.moveToThread(QgsApplication.instance().thread())
+        return layer_3d
+
+    def finished(exception, layer_3d=None):
+        if exception is None and layer_3d is not None:
+            QgsProject.instance().addMapLayer(layer_3d)
+
+    return QgsTask.fromFunction(f"Create 3D arcs from {layer.name()}", run, on_finished=finished)
+
+def process_3d_arcs(algorithm, parameters: dict, context, feedback, source, arc_parameters: Callable, parameter_field_names: Optional[List[str]] = None) -> str:
+    """
+    Run the arc pipeline of a processing algorithm, from its parameters to its sink.
+
+    The algorithms only differ by where the segments, y_angle and z_scale of
+    the arcs come from. This reads all their other parameters, the ones of
+    Arc3DAlgorithm, then shares out the vertex budget, builds the arcs of
+    whole chunks, with levels of detail, the cache or neither, and writes
+    them to the sink.
+
+    Parameters:
+    algorithm (QgsProcessingAlgorithm): The algorithm, with the parameters of Arc3DAlgorithm.
+    parameters (dict): The parameter values of the run.
+    context (QgsProcessingContext): The context of the run.
+    feedback (QgsProcessingFeedback): Receives the progress and the reports, and is checked for cancellation.
+    source (QgsProcessingFeatureSource): The input features.
+    arc_parameters (Callable): Returns the segments, y_angle and z_scale of a chunk of features, scalars or one per feature.
+    parameter_field_names (List[str]): The fields arc_parameters reads, on top of the kept ones.
+
+    Returns:
+    str: The ID of the sink.
+
+    """
+    legacy = algorithm.parameterAsBool(parameters, algorithm.LEGACY, context)
+    batch_size = algorithm.parameterAsInt(parameters, algorithm.BATCH_SIZE, context)
+    native_crs = algorithm.parameterAsBool(parameters, algorithm.NATIVE_CRS, context)
+    great_circle = algorithm.parameterAsBool(parameters, algorithm.GREAT_CIRCLE, context)
+    profile = ARC_PROFILES[algorithm.parameterAsEnum(parameters, algorithm.PROFILE, context)]
+    max_error = algorithm.parameterAsDouble(parameters, algorithm.MAX_ERROR, context)
+    length_field = algorithm.parameterAsString(parameters, algorithm.LENGTH_field, context)
+    vertex_budget = algorithm.parameterAsInt(parameters, algorithm.VERTEX_BUDGET, context)
+    weight_field = algorithm.parameterAsString(parameters, algorithm.WEIGHT_field, context)
+    threads = algorithm.parameterAsInt(parameters, algorithm.THREADS, context)
+    workers = algorithm.parameterAsInt(parameters, algorithm.WORKERS, context)
+    field_names = algorithm.parameterAsFields(parameters, algorithm.FIELDS, context)
+    fields = kept_fields(source.fields(), field_names)
+    cache_path = algorithm.parameterAsFileOutput(parameters, algorithm.CACHE, context)
+    try:
+        lod_segments = parse_lod_segments(algorithm.parameterAsString(parameters, algorithm.LOD_SEGMENTS, context))
+    except ValueError as error:
+        raise QgsProcessingException(f"Invalid levels of detail: {error}")
+    if lod_segments:
+        # Every level of detail is a feature of its own
+        fields = lod_fields(fields)
+    (sink, dest_id) = algorithm.parameterAsSink(parameters, algorithm.OUTPUT, context, fields, QgsWkbTypes.LineStringZ, source.sourceCrs())
+
+    progress = ProgressReporter(feedback, max(source.featureCount(), 0) * max(len(lod_segments), 1))
+    # Read only the kept fields and those holding the arc parameters and the lengths
+    read_field_names = field_names + list(parameter_field_names or []) + ([length_field] if length_field else []) if field_names else []
+    features = source.getFeatures(attribute_subset_request(source.fields(), read_field_names))
+    # Arcs built in the CRS of the source need no transform, those of
+    # geographic sources are built on planes touching the globe
+    endpoint_transform = None if native_crs else transform_to_3d_crs(source.sourceCrs())
+    transform = None if native_crs else transform_from_3d_crs(source.sourceCrs())
+    geographic = native_crs and source.sourceCrs().isGeographic()
+    # Arcs built in EPSG:3857 stretch the ground lengths of the field with the latitude
+    mercator = not great_circle and (not native_crs or source.sourceCrs().authid() == f"EPSG:{EPSG_3D_CODE}")
+    if great_circle:
+        # Great circles are built from longitudes and latitudes, whatever the CRS of the arcs would be
+        endpoint_transform, transform = transform_to_lon_lat(source.sourceCrs()), transform_from_lon_lat(source.sourceCrs())
+        geographic = False
+    cache_info = arc_template.cache_info()
+    dedup_stats = DedupStats()
+
+    def arc_lengths(chunk):
+        # The lengths the adaptive segments are chosen from
+        return [feature[length_field] for feature in chunk]
+
+    if vertex_budget and lod_segments:
+        feedback.pushInfo("The vertex budget is not used with levels of detail")
+    elif vertex_budget:
+        if max_error:
+            feedback.pushInfo("The vertex budget replaces the maximum distance to the true curves")
+            max_error = 0.0
+
+        def arc_weights(chunk):
+            # The weights the vertex budget is shared by
+            return [feature[weight_field] for feature in chunk]
+
+        # A first pass reads the weight of every feature, only then can the segments be shared out
+        weight_request = attribute_subset_request(source.fields(), [weight_field]) if weight_field else QgsFeatureRequest().setNoAttributes()
+        weight_chunks = feature_endpoint_chunks(source.getFeatures(weight_request), batch_size, endpoint_transform)
+        fids, weights = feature_weights(weight_chunks, geographic or great_circle, arc_weights if weight_field else None)
+        try:
+            arc_parameters = budget_parameters(arc_parameters, fids, budget_segments(weights, vertex_budget))
+        except ValueError as error:
+            raise QgsProcessingException(f"Invalid vertex budget: {error}")
+        feedback.pushInfo(f"Vertex budget: {vertex_budget} vertices shared between {len(fids)} arcs")
+    chunks = feature_endpoint_chunks(features, batch_size, endpoint_transform)
+    arc_options = dict(legacy=legacy, transform=transform, geographic=geographic, threads=threads, processes=workers, great_circle=great_circle, profile=profile, stats=dedup_stats)
+    length_options = dict(max_error=max_error, lengths=arc_lengths if length_field else None, mercator=mercator)
+    # Generate the arcs of whole chunks at once, on worker threads or processes
+    if lod_segments:
+        if cache_path:
+            feedback.pushInfo("The arc cache is not used with levels of detail")
+        cache = None
+        lod_chunks = lod_3d_polyline_chunks(chunks, arc_parameters, lod_segments, **arc_options)
+        arc_chunks = ((chunk, vertices, polylines_3d) for chunk, _, vertices, polylines_3d in lod_chunks)
+    elif cache_path:
+        # The arcs also depend on the CRS they are built in
+        cache = ArcCache(cache_path, f"legacy={legacy} native_crs={native_crs} great_circle={great_circle} profile={profile} crs={source.sourceCrs().authid()}")
+        arc_chunks = cached_3d_polyline_chunks(chunks, arc_parameters, cache, **arc_options, **length_options)
+    else:
+        cache = None
+        arc_chunks = generate_3d_polyline_chunks(chunks, arc_parameters, **arc_options, **length_options)
+    for chunk, _, polylines_3d in arc_chunks:
+        # Stop the algorithm if cancel button has been clicked, as of the last progress update
+        if progress.canceled:
+            break
+        if lod_segments:
+            # Add the whole chunk to the sink, with the level of detail it was built for
+            sink.addFeatures(lod_arc_features(fields, polylines_3d, chunk, chunk.segments), QgsFeatureSink.FastInsert)
+        else:
+            for feature, feature_3d_polyline in zip(chunk, polylines_3d):
+                feature.setGeometry(feature_3d_polyline)
+            if field_names:
+                keep_attributes(chunk, fields)
+            # Add the whole chunk to the sink
+            sink.addFeatures(chunk, QgsFeatureSink.FastInsert)
+
+        # Update the progress bar, throttled
+        progress.update(len(chunk))
+    progress.finish()
+    feedback.pushInfo(template_cache_report(cache_info))
+    feedback.pushInfo(dedup_stats.report())
+    if cache is not None:
+        feedback.pushInfo(cache.report())
+        cache.close()
+    if lod_segments and context.willLoadLayerOnCompletion(dest_id):
+        # Draw a single level of detail at each scale once the output is loaded
+        context.layerToLoadOnCompletionDetails(dest_id).setPostProcessor(LodRendererPostProcessor.create(lod_segments))
+    return dest_id
+
 if __name__ == "__main__":
     layer = iface.activeLayer()
     segments, y_angle, z_scale = 10, 90, 0.5
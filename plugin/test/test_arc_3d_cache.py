@@ -0,0 +1,70 @@
+"""
+Tests of the SQLite arc cache, which only needs NumPy.
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..arc_3d_cache import ArcCache
+from ..arc_3d_engine import generate_3d_arcs, linestring_z_wkb
+
+
+class ArcCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'arcs.sqlite')
+        generator = np.random.default_rng(0)
+        self.starts = generator.uniform(-1e5, 1e5, (10, 2))
+        self.ends = generator.uniform(-1e5, 1e5, (10, 2))
+        self.fids = list(range(10))
+        vertices, offsets = generate_3d_arcs(self.starts, self.ends, 5, 90, 0.5)
+        self.wkbs = linestring_z_wkb(vertices, offsets)
+
+    def open_cache(self, settings='legacy=False'):
+        cache = ArcCache(self.path, settings)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_reuses_stored_arcs_between_runs(self):
+        cache = self.open_cache()
+        keys = cache.keys(self.starts, self.ends, 5, 90, 0.5)
+        self.assertEqual(cache.lookup(self.fids, keys), [None] * 10)
+        cache.store(self.fids, keys, self.wkbs)
+        cache.close()
+
+        cache = self.open_cache()
+        keys = cache.keys(self.starts, self.ends, 5, 90, 0.5)
+        self.assertEqual(cache.lookup(self.fids, keys), self.wkbs)
+        self.assertEqual((cache.hits, cache.misses), (10, 0))
+        self.assertIn("10 arcs reused, 0 rebuilt", cache.report())
+
+    def test_changed_arcs_are_rebuilt(self):
+        cache = self.open_cache()
+        cache.store(self.fids, cache.keys(self.starts, self.ends, 5, 90, 0.5), self.wkbs)
+        starts = self.starts.copy()
+        starts[3] += 1
+        segments = np.full(10, 5)
+        segments[7] = 6
+        found = cache.lookup(self.fids, cache.keys(starts, self.ends, segments, 90, 0.5))
+        self.assertEqual([index for index, wkb in enumerate(found) if wkb is None], [3, 7])
+
+    def test_other_settings_never_match(self):
+        cache = self.open_cache()
+        cache.store(self.fids, cache.keys(self.starts, self.ends, 5, 90, 0.5), self.wkbs)
+        other = self.open_cache('legacy=True')
+        self.assertEqual(other.lookup(self.fids, other.keys(self.starts, self.ends, 5, 90, 0.5)), [None] * 10)
+
+    def test_lookup_of_more_fids_than_a_statement_takes(self):
+        cache = self.open_cache()
+        fids = list(range(1200))
+        keys = [bytes(16)] * 1200
+        cache.store(fids, keys, [b'arc'] * 1200)
+        self.assertEqual(cache.lookup(fids, keys), [b'arc'] * 1200)
+
+
+if __name__ == '__main__':
+    unittest.main()
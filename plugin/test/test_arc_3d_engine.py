@@ -0,0 +1,289 @@
+"""
+Tests of the arc math, which only needs NumPy.
+"""
+import os
+import unittest
+
+import numpy as np
+
+from ..arc_3d_engine import (EARTH_RADIUS, WEB_MERCATOR_RADIUS, _half_circle, _unit_vectors, adaptive_segments, arc_offsets, arc_rows, benchmark_arcs, budget_segments,
+                             chord_lengths, generate_3d_arcs, generate_3d_arcs_geographic, generate_3d_arcs_great_circle, linestring_z_vertices,
+                             linestring_z_wkb, mercator_lengths, rotation_y, rotation_z, scale_z, unique_arcs)
+
+
+def random_lines(count, seed=0):
+    generator = np.random.default_rng(seed)
+    return generator.uniform(-1e5, 1e5, (count, 2)), generator.uniform(-1e5, 1e5, (count, 2))
+
+
+def matrix_chain_arc(start, end, segments, y_angle, z_scale):
+    """
+    Build one arc the way earlier versions of the plugin did, one matrix at a time.
+    """
+    radius = np.hypot(*(start - end)) / 2
+    bearing = np.degrees(np.arctan2(start[0] - end[0], start[1] - end[1]))
+    points = np.hstack([_half_circle(segments) * radius, np.ones((2 * segments + 1, 1))])
+    points = points @ rotation_y(np.radians(y_angle - 90)) @ rotation_z(np.radians(bearing)) @ scale_z(z_scale)
+    points[:, :2] += (start + end) / 2
+    return points[:, :3]
+
+
+def polyline_distance(points, polyline):
+    """
+    Distance of each point from the nearest segment of a polyline.
+    """
+    first, second = polyline[:-1], polyline[1:]
+    direction = second - first
+    relative = points[:, None, :] - first[None, :, :]
+    along = np.clip(np.einsum('psk,sk->ps', relative, direction) / np.einsum('sk,sk->s', direction, direction), 0, 1)
+    return np.linalg.norm(relative - along[..., None] * direction, axis=2).min(axis=1)
+
+
+class GenerateArcsTest(unittest.TestCase):
+
+    def test_arcs_run_exactly_from_end_to_start(self):
+        starts, ends = random_lines(100)
+        vertices, offsets = generate_3d_arcs(starts, ends, 7, 60, 0.5)
+        np.testing.assert_allclose(vertices[offsets[:-1], :2], ends, rtol=0, atol=1e-9)
+        np.testing.assert_allclose(vertices[offsets[1:] - 1, :2], starts, rtol=0, atol=1e-9)
+        np.testing.assert_array_equal(vertices[offsets[:-1], 2], 0)
+        np.testing.assert_array_equal(vertices[offsets[1:] - 1, 2], 0)
+
+    def test_matches_the_matrix_chain(self):
+        starts, ends = random_lines(20, seed=1)
+        segments = np.arange(1, 21)
+        y_angles = np.linspace(10, 90, 20)
+        z_scales = np.linspace(0.1, 1, 20)
+        vertices, offsets = generate_3d_arcs(starts, ends, segments, y_angles, z_scales)
+        for index in range(20):
+            expected = matrix_chain_arc(starts[index], ends[index], segments[index], y_angles[index], z_scales[index])
+            np.testing.assert_allclose(vertices[offsets[index]:offsets[index + 1]], expected, rtol=0, atol=1e-6)
+
+    def test_parabola_profile_keeps_the_endpoints_and_apex(self):
+        vertices, offsets = generate_3d_arcs([[0.0, 0.0]], [[100.0, 0.0]], 4, 90, 0.5, profile='parabola')
+        np.testing.assert_allclose(vertices[[0, 4, 8]], [[100, 0, 0], [50, 0, 25], [0, 0, 0]], atol=1e-9)
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            generate_3d_arcs([[0.0, 0.0]], [[1.0, 0.0]], 4, 90, 0.5, profile='square')
+
+    def test_writes_into_a_preallocated_array(self):
+        starts, ends = random_lines(10)
+        expected, offsets = generate_3d_arcs(starts, ends, 3, 90, 0.5)
+        out = np.empty((offsets[-1], 3))
+        vertices, _ = generate_3d_arcs(starts, ends, 3, 90, 0.5, out=out)
+        self.assertIs(vertices, out)
+        np.testing.assert_array_equal(out, expected)
+
+    def test_empty_batches(self):
+        empty = np.empty((0, 2))
+        for generate in (generate_3d_arcs, generate_3d_arcs_geographic, generate_3d_arcs_great_circle):
+            vertices, offsets = generate(empty, empty, 5, 90, 0.5)
+            self.assertEqual(vertices.shape, (0, 3))
+            np.testing.assert_array_equal(offsets, [0])
+        self.assertEqual(linestring_z_wkb(np.empty((0, 3)), np.zeros(1, dtype=np.int64)), [])
+        vertices, offsets = linestring_z_vertices([])
+        self.assertEqual(vertices.shape, (0, 3))
+        self.assertEqual(unique_arcs(arc_rows(empty, empty, 5, 90, 0.5))[0].shape, (0, 7))
+
+
+class OffsetsAndWkbTest(unittest.TestCase):
+
+    def test_arc_offsets(self):
+        np.testing.assert_array_equal(arc_offsets([1, 2, 3], 3), [0, 3, 8, 15])
+        np.testing.assert_array_equal(arc_offsets(4, 2), [0, 9, 18])
+
+    def test_wkb_round_trip(self):
+        starts, ends = random_lines(50)
+        vertices, offsets = generate_3d_arcs(starts, ends, np.arange(50) % 5 + 1, 90, 0.5)
+        records = linestring_z_wkb(vertices, offsets)
+        self.assertEqual(len(records), 50)
+        # Little endian LineStringZ with its number of points
+        self.assertEqual(records[0][:5], b'\x01\xea\x03\x00\x00')
+        decoded, decoded_offsets = linestring_z_vertices(records)
+        np.testing.assert_array_equal(decoded, vertices)
+        np.testing.assert_array_equal(decoded_offsets, offsets)
+
+
+class UniqueArcsTest(unittest.TestCase):
+
+    def test_inverse_rebuilds_the_rows(self):
+        starts, ends = random_lines(5)
+        rows = arc_rows(starts[[0, 1, 0, 2, 1, 0]], ends[[0, 1, 0, 2, 1, 0]], 5, 90, [0.5, 0.5, 0.5, 0.5, 0.5, 0.25])
+        distinct, inverse = unique_arcs(rows)
+        # The last row only differs by its z-scale
+        self.assertEqual(distinct.shape, (4, 7))
+        np.testing.assert_array_equal(distinct[inverse], rows)
+
+    def test_single_row(self):
+        rows = arc_rows([[0.0, 0.0]], [[1.0, 1.0]], 5, 90, 0.5)
+        distinct, inverse = unique_arcs(rows)
+        np.testing.assert_array_equal(distinct, rows)
+        np.testing.assert_array_equal(inverse, [0])
+
+
+class AdaptiveSegmentsTest(unittest.TestCase):
+
+    def assert_within_error(self, profile, lengths, z_scale, max_error):
+        segments = adaptive_segments(lengths, z_scale, max_error, profile=profile)
+        for length, segment_count in zip(lengths, segments):
+            coarse, _ = generate_3d_arcs([[0.0, 0.0]], [[length, 0.0]], segment_count, 90, z_scale, profile=profile)
+            fine, _ = generate_3d_arcs([[0.0, 0.0]], [[length, 0.0]], segment_count * 64, 90, z_scale, profile=profile)
+            self.assertLessEqual(polyline_distance(fine, coarse).max(), max_error * (1 + 1e-9))
+
+    def test_circle_within_error(self):
+        self.assert_within_error('circle', [10.0, 1000.0, 50000.0], 1.0, 5.0)
+
+    def test_parabola_within_error(self):
+        self.assert_within_error('parabola', [10.0, 1000.0, 50000.0], 0.5, 5.0)
+
+    def test_bounds(self):
+        np.testing.assert_array_equal(adaptive_segments([0.0, 1.0, 1e12], 0.5, 1.0, max_segments=30), [1, 1, 30])
+        np.testing.assert_array_equal(adaptive_segments([0.0, 1e12], 0.5, 1.0, max_segments=30, profile='parabola'), [1, 30])
+
+    def test_mercator_lengths(self):
+        # Web Mercator doubles lengths at 60 degrees of latitude
+        y = WEB_MERCATOR_RADIUS * np.log(np.tan(np.radians(45 + 30)))
+        np.testing.assert_allclose(mercator_lengths([1000.0, 1000.0], [[0.0, 0.0], [0.0, y]], [[10.0, 0.0], [10.0, y]]), [1000.0, 2000.0])
+
+    def test_longer_arcs_get_more_segments(self):
+        segments = adaptive_segments(np.geomspace(1, 1e6, 50), 0.5, 1.0)
+        self.assertTrue(np.all(np.diff(segments) >= 0))
+
+
+class BudgetSegmentsTest(unittest.TestCase):
+
+    def test_uses_up_an_even_budget(self):
+        weights = np.random.default_rng(0).random(1000)
+        segments = budget_segments(weights, 20000)
+        self.assertEqual(arc_offsets(segments, 1000)[-1], 20000)
+
+    def test_odd_budget_leaves_one_vertex(self):
+        weights = np.random.default_rng(0).random(1000)
+        segments = budget_segments(weights, 20001)
+        self.assertEqual(arc_offsets(segments, 1000)[-1], 20000)
+
+    def test_heavier_arcs_get_more_segments(self):
+        weights = np.random.default_rng(1).random(1000)
+        segments = budget_segments(weights, 50000)
+        self.assertTrue(np.all(np.diff(segments[np.argsort(weights)]) >= 0))
+        self.assertTrue(np.all(segments >= 1))
+
+    def test_missing_weights(self):
+        np.testing.assert_array_equal(budget_segments([1, 2, np.nan, 0], 20), [2, 4, 1, 1])
+        np.testing.assert_array_equal(budget_segments([0, 0, 0], 13), [2, 2, 1])
+        self.assertEqual(budget_segments([], 10).size, 0)
+
+    def test_budget_below_the_minimum(self):
+        with self.assertRaises(ValueError):
+            budget_segments([1, 2], 5)
+
+
+class GreatCircleTest(unittest.TestCase):
+
+    def test_endpoints_and_ground_track(self):
+        generator = np.random.default_rng(2)
+        starts = generator.uniform([-180, -80], [180, 80], (200, 2))
+        ends = generator.uniform([-180, -80], [180, 80], (200, 2))
+        vertices, offsets = generate_3d_arcs_great_circle(starts, ends, 8, 90, 0.5)
+        np.testing.assert_array_equal(vertices[offsets[:-1], :2], ends)
+        # The start points are only moved by whole turns
+        np.testing.assert_array_equal(vertices[offsets[1:] - 1, 1], starts[:, 1])
+        np.testing.assert_allclose((vertices[offsets[1:] - 1, 0] - starts[:, 0] + 180) % 360 - 180, 0, atol=1e-9)
+        # Upright arcs stay in the plane of their great circle
+        normals = np.cross(_unit_vectors(ends), _unit_vectors(starts))
+        normals /= np.linalg.norm(normals, axis=1)[:, None]
+        arcs = np.repeat(np.arange(200), np.diff(offsets))
+        distances = np.einsum('ij,ij->i', _unit_vectors(vertices[:, :2]), normals[arcs])
+        np.testing.assert_allclose(distances, 0, atol=1e-9)
+
+    def test_antimeridian_crossings_do_not_jump(self):
+        vertices, offsets = generate_3d_arcs_great_circle([[170.0, -35.0], [-150.0, -30.0]], [[-150.0, -30.0], [170.0, -35.0]], 6, 90, 0.5)
+        for index in range(2):
+            longitudes = vertices[offsets[index]:offsets[index + 1], 0]
+            self.assertLess(np.abs(np.diff(longitudes)).max(), 10)
+        np.testing.assert_array_equal(vertices[[0, 12, 13, 25], 0], [-150, -190, 170, 210])
+
+    def test_height_in_meters(self):
+        vertices, offsets = generate_3d_arcs_great_circle([[0.0, 0.0]], [[90.0, 0.0]], 8, 90, 0.5)
+        # A quarter of the equator, the apex is at half of half its length
+        self.assertAlmostEqual(vertices[8, 2], EARTH_RADIUS * np.pi / 4 * 0.5, places=3)
+        self.assertAlmostEqual(vertices[8, 0], 45.0)
+
+    def test_identical_points(self):
+        vertices, _ = generate_3d_arcs_great_circle([[10.0, 20.0]], [[10.0, 20.0]], 4, 90, 0.5)
+        np.testing.assert_allclose(vertices[:, :2], [[10.0, 20.0]] * 9, atol=1e-9)
+        np.testing.assert_allclose(vertices[:, 2], 0, atol=1e-6)
+
+    def test_chord_lengths(self):
+        self.assertAlmostEqual(chord_lengths([[0.0, 0.0]], [[90.0, 0.0]], geographic=True)[0], EARTH_RADIUS * np.pi / 2, places=3)
+        np.testing.assert_array_equal(chord_lengths([[0.0, 0.0]], [[3.0, 4.0]]), [5.0])
+
+
+class GeographicTest(unittest.TestCase):
+
+    def test_endpoints(self):
+        generator = np.random.default_rng(3)
+        starts = generator.uniform([-180, -80], [180, 80], (200, 2))
+        ends = starts + generator.uniform(-20, 20, (200, 2))
+        vertices, offsets = generate_3d_arcs_geographic(starts, ends, 8, 60, 0.5)
+        np.testing.assert_allclose(vertices[offsets[:-1], 1], ends[:, 1], atol=1e-9)
+        np.testing.assert_allclose(vertices[offsets[1:] - 1, 1], starts[:, 1], atol=1e-9)
+        np.testing.assert_allclose((vertices[offsets[:-1], 0] - ends[:, 0] + 180) % 360 - 180, 0, atol=1e-9)
+        np.testing.assert_allclose((vertices[offsets[1:] - 1, 0] - starts[:, 0] + 180) % 360 - 180, 0, atol=1e-9)
+
+    def test_antipodal_endpoints(self):
+        vertices, offsets = generate_3d_arcs_geographic([[10.0, 0.0], [0.0, 0.0]], [[-170.0, 0.0], [1.0, 1.0]], 3, 90, 0.5)
+        self.assertTrue(np.all(np.isfinite(vertices)))
+        np.testing.assert_allclose(vertices[[0, 6]], [[-170, 0, 0], [10, 0, 0]], atol=1e-9)
+        # Half way round the globe, over a pole
+        self.assertAlmostEqual(abs(vertices[3, 1]), 90.0)
+        self.assertAlmostEqual(vertices[3, 2], EARTH_RADIUS * np.pi / 2 * 0.5, places=3)
+
+    def test_long_arcs_keep_their_height_and_spacing(self):
+        # Tel Aviv to Auckland, then ever closer to the other side of the globe
+        starts = np.array([[34.8, 32.0], [0.0, 0.0], [0.0, 0.0], [0.0, 0.0], [20.0, 10.0]])
+        ends = np.array([[174.8, -36.8], [150.0, 0.0], [179.0, 0.0], [179.9999, 0.0], [-165.0, -5.0]])
+        vertices, offsets = generate_3d_arcs_geographic(starts, ends, 10, 90, 0.5)
+        angles = chord_lengths(starts, ends, geographic=True) / EARTH_RADIUS
+        self.assertTrue(np.all(np.degrees(angles[1:]) >= 150))
+        # The apex is a quarter of the length of the great circle high
+        np.testing.assert_allclose(vertices[offsets[:-1] + 10, 2], EARTH_RADIUS * angles / 4, rtol=1e-9)
+        np.testing.assert_allclose(vertices[offsets[3] + 10, 0], 89.99995, atol=1e-9)
+        # The vertices are where the great circle arcs put them, evenly spread along the route
+        expected, _ = generate_3d_arcs_great_circle(starts, ends, 10, 90, 0.5)
+        np.testing.assert_allclose(vertices, expected, rtol=0, atol=1e-6)
+        ground = _unit_vectors(vertices[:, :2])
+        steps = np.arccos(np.clip(np.einsum('ij,ij->i', ground[:-1], ground[1:]), -1, 1))
+        for index, angle in enumerate(angles):
+            arc_steps = steps[offsets[index]:offsets[index + 1] - 1]
+            # Half circle vertices are at most pi / 20 of the half length apart on the ground
+            self.assertLessEqual(arc_steps.max(), angle / 2 * np.sin(np.pi / 20) * (1 + 1e-9))
+
+    def test_no_jump_next_to_antipodal_endpoints(self):
+        vertices, offsets = generate_3d_arcs_geographic([[0.0, 0.0], [0.0, 0.0]], [[179.9999, 0.0], [180.0, 0.0]], 4, 90, 0.5)
+        np.testing.assert_allclose(vertices[offsets[0] + 4, 2], vertices[offsets[1] + 4, 2], rtol=1e-6)
+
+    def test_antimeridian_crossings_do_not_jump(self):
+        vertices, offsets = generate_3d_arcs_geographic([[170.0, -35.0]], [[-150.0, -30.0]], 6, 90, 0.5)
+        self.assertLess(np.abs(np.diff(vertices[:, 0])).max(), 10)
+        np.testing.assert_allclose(vertices[[0, -1], 0], [-150, -190], atol=1e-9)
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_benchmark_arcs(self):
+        result = benchmark_arcs(count=2000, segments=10, repeat=2)
+        self.assertEqual(result['arcs'], 2000)
+        self.assertEqual(result['vertices'], 2000 * 21)
+        self.assertGreater(result['seconds'], 0)
+
+    @unittest.skipUnless(os.environ.get('ARC_3D_BENCHMARK'), "set ARC_3D_BENCHMARK to time the arc kernel")
+    def test_throughput(self):
+        result = benchmark_arcs(count=20000, segments=10, repeat=2)
+        # Far below what the kernel does on any machine, it only catches a fall back to per-arc work
+        self.assertGreater(result['arcs_per_second'], 20000)
+
+
+if __name__ == '__main__':
+    unittest.main()
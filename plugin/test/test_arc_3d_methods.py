@@ -0,0 +1,183 @@
+"""
+Tests of the QGIS side of the plugin, skipped where QGIS is not installed.
+
+The transforms are replaced by plain NumPy functions, so no CRS is needed.
+"""
+import importlib.util
+import multiprocessing.spawn
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+HAS_QGIS = importlib.util.find_spec('qgis') is not None
+
+if HAS_QGIS:
+    from .. import arc_3d_methods
+    from ..arc_3d_cache import ArcCache
+
+
+class Feature:
+    """
+    The part of QgsFeature the arc pipeline uses.
+    """
+
+    def __init__(self, fid):
+        self.fid = fid
+
+    def id(self):
+        return self.fid
+
+
+def fake_transform(coordinates, transform):
+    coordinates = np.array(coordinates, dtype=float)
+    return np.column_stack([coordinates[:, 0] * 2 + 1, coordinates[:, 1] - 3])
+
+
+@unittest.skipUnless(HAS_QGIS, "QGIS is not installed")
+class TransformUniqueCoordinatesTest(unittest.TestCase):
+
+    def test_transforms_each_distinct_coordinate_once(self):
+        coordinates = np.array([[0.0, 0.0], [1.0, 2.0], [0.0, 0.0], [1.0, 2.0]])
+        with mock.patch.object(arc_3d_methods, 'transform_coordinates', side_effect=fake_transform) as transform:
+            transformed = arc_3d_methods.transform_unique_coordinates(coordinates, None, {})
+        np.testing.assert_array_equal(transformed, fake_transform(coordinates, None))
+        self.assertEqual(len(transform.call_args[0][0]), 2)
+
+    def test_cache_overflow_keeps_the_hits_of_the_chunk(self):
+        cache = {}
+        first = np.column_stack([np.arange(6.0), np.zeros(6)])
+        # One point seen before and five new ones overflow a cache of 10
+        second = np.column_stack([np.arange(5.0, 11.0), np.ones(6)])
+        second[0] = first[5]
+        with mock.patch.object(arc_3d_methods, 'TRANSFORM_CACHE_SIZE', 10), \
+                mock.patch.object(arc_3d_methods, 'transform_coordinates', side_effect=fake_transform):
+            arc_3d_methods.transform_unique_coordinates(first, None, cache)
+            transformed = arc_3d_methods.transform_unique_coordinates(second, None, cache)
+        np.testing.assert_array_equal(transformed, fake_transform(second, None))
+        self.assertLessEqual(len(cache), 10)
+
+
+
+@unittest.skipUnless(HAS_QGIS, "QGIS is not installed")
+class DedupStatsTest(unittest.TestCase):
+
+    def chunks(self):
+        starts = np.array([[0.0, 0.0], [1.0, 1.0], [0.0, 0.0]])
+        ends = np.array([[5.0, 5.0], [6.0, 6.0], [5.0, 5.0]])
+        for first in (0, 3):
+            yield list(range(first, first + 3)), starts, ends
+
+    def test_counts_each_run_on_its_own(self):
+        for _ in range(2):
+            stats = arc_3d_methods.DedupStats()
+            chunks = list(arc_3d_methods.generate_3d_polyline_chunks(self.chunks(), lambda features: (5, 90, 0.5), threads=2, stats=stats))
+            self.assertEqual([len(polylines_3d) for _, _, polylines_3d in chunks], [3, 3])
+            self.assertEqual((stats.features, stats.arcs), (6, 4))
+            self.assertIn("1.50 features per arc", stats.report())
+
+
+
+@unittest.skipUnless(HAS_QGIS, "QGIS is not installed")
+class CachedChunksTest(unittest.TestCase):
+
+    def chunks(self, starts):
+        ends = starts[::-1] + 1000
+        for first in range(0, len(starts), 4):
+            yield [Feature(fid) for fid in range(first, first + 4)], starts[first:first + 4], ends[first:first + 4]
+
+    def test_partial_hits_keep_the_input_order(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'arcs.sqlite')
+        starts = np.random.default_rng(0).uniform(-1e5, 1e5, (12, 2))
+        parameters = lambda features: (5, 90, 0.5)
+        cache = ArcCache(path)
+        list(arc_3d_methods.cached_3d_polyline_chunks(self.chunks(starts), parameters, cache))
+        cache.close()
+
+        changed = starts.copy()
+        changed[[1, 6, 7, 11]] += 10
+        expected = [bytes(polyline_3d.asWkb()) for _, _, polylines_3d in arc_3d_methods.generate_3d_polyline_chunks(self.chunks(changed), parameters) for polyline_3d in polylines_3d]
+        # The first run finds some of the arcs, the second one all of them
+        for kwargs in ({}, {'threads': 3}):
+            cache = ArcCache(path)
+            self.addCleanup(cache.close)
+            chunks = list(arc_3d_methods.cached_3d_polyline_chunks(self.chunks(changed), parameters, cache, **kwargs))
+            self.assertEqual([[feature.id() for feature in features] for features, _, _ in chunks], [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]])
+            self.assertEqual([bytes(polyline_3d.asWkb()) for _, _, polylines_3d in chunks for polyline_3d in polylines_3d], expected)
+            if not kwargs:
+                self.assertEqual((cache.hits, cache.misses), (4, 8))
+
+    def test_parameters_are_worked_out_once_per_chunk(self):
+        starts = np.random.default_rng(1).uniform(-1e5, 1e5, (12, 2))
+        parameters = mock.Mock(return_value=(5, 90, np.linspace(0.1, 1, 4)))
+        lengths = lambda features: [None, 1e6, None, 10.0]
+        kwargs = {'max_error': 50.0, 'lengths': lengths, 'profile': 'parabola'}
+        expected = [bytes(polyline_3d.asWkb()) for _, _, polylines_3d in arc_3d_methods.generate_3d_polyline_chunks(self.chunks(starts), parameters, **kwargs) for polyline_3d in polylines_3d]
+        parameters.reset_mock()
+        cache = ArcCache(':memory:')
+        self.addCleanup(cache.close)
+        chunks = list(arc_3d_methods.cached_3d_polyline_chunks(self.chunks(starts), parameters, cache, **kwargs))
+        self.assertEqual(parameters.call_count, 3)
+        self.assertEqual([bytes(polyline_3d.asWkb()) for _, _, polylines_3d in chunks for polyline_3d in polylines_3d], expected)
+
+
+@unittest.skipUnless(HAS_QGIS, "QGIS is not installed")
+class OrderedParallelMapTest(unittest.TestCase):
+
+    def run_processes(self, executable):
+        previous = multiprocessing.spawn.get_executable()
+        self.addCleanup(multiprocessing.spawn.set_executable, previous)
+        used = []
+        with mock.patch.object(arc_3d_methods.sys, 'executable', executable):
+            interpreter = arc_3d_methods._python_executable()
+            for key, result in arc_3d_methods.ordered_parallel_map(abs, ((value, (value,)) for value in range(-4, 4)), 2, processes=True):
+                self.assertEqual(result, abs(key))
+                used.append(multiprocessing.spawn.get_executable())
+        return previous, interpreter, used
+
+    def test_keeps_the_interpreter_of_python(self):
+        previous, _, used = self.run_processes(sys.executable)
+        self.assertEqual(set(used), {previous})
+        self.assertEqual(multiprocessing.spawn.get_executable(), previous)
+
+    def test_sets_the_interpreter_back_after_qgis(self):
+        previous, interpreter, used = self.run_processes(os.path.join(os.path.dirname(sys.executable), 'qgis'))
+        # POSIX keeps the interpreter as bytes
+        self.assertEqual({os.fsdecode(path) for path in used}, {interpreter})
+        self.assertNotEqual(interpreter, os.fsdecode(previous))
+        self.assertEqual(multiprocessing.spawn.get_executable(), previous)
+
+
+@unittest.skipUnless(HAS_QGIS, "QGIS is not installed")
+class MainTaskTest(unittest.TestCase):
+
+    def run_task(self, canceled):
+        task = mock.Mock()
+        task.isCanceled.return_value = canceled
+        with mock.patch.object(arc_3d_methods, 'QgsVectorLayerFeatureSource'), \
+                mock.patch.object(arc_3d_methods, 'QgsTask') as task_class, \
+                mock.patch.object(arc_3d_methods, 'QgsApplication'), \
+                mock.patch.object(arc_3d_methods, 'QgsProject') as project, \
+                mock.patch.object(arc_3d_methods, 'main') as main:
+            arc_3d_methods.main_task(mock.Mock(), 10, 90, 0.5)
+            _, run = task_class.fromFunction.call_args[0]
+            finished = task_class.fromFunction.call_args[1]['on_finished']
+            finished(None, run(task))
+        return main.return_value, project.instance.return_value.addMapLayer
+
+    def test_adds_the_layer_once_done(self):
+        layer_3d, add_map_layer = self.run_task(canceled=False)
+        add_map_layer.assert_called_once_with(layer_3d)
+
+    def test_drops_the_layer_of_a_cancelled_run(self):
+        _, add_map_layer = self.run_task(canceled=True)
+        add_map_layer.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()